@@ -0,0 +1,111 @@
+"""
+Load benchmark against the offline mock server (tests/mock_server.py).
+
+For each fleet size it reports websocket connect latency (auth and
+subscribe of every device on one hub), notification throughput, command
+round trip p50/p99 and memory per RyobiGDO. Server and client share one
+process and event loop, so throughput is a lower bound.
+
+    python benchmarks/bench_fleet.py [sizes...]
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")) #Run from a checkout.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")) #For the mock server.
+
+from ryobigdopy import ws_api
+from ryobigdopy.auth import AsyncAuth
+from ryobigdopy.device_directory import DeviceDirectory
+from ryobigdopy.ryobigdo import RyobiGDO
+from ryobigdopy.state import StateStore
+from mock_server import MockRyobiServer
+
+NOTIFICATIONS = 20000
+COMMANDS = 200
+
+def percentile(samples, percent):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+async def wait_for(condition, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Benchmark condition not reached.")
+        await asyncio.sleep(0.001)
+
+async def bench(size):
+    server = MockRyobiServer(devices=size)
+    await server.start()
+    auth = AsyncAuth(
+        {"username": server.username, "password": server.password},
+        http_endpoint=server.http_endpoint,
+        ws_endpoint=server.ws_endpoint,
+    )
+    await auth.login()
+
+    directory = DeviceDirectory(max_size=size)
+    await directory.async_refresh(auth)
+    store = StateStore()
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    devices = [RyobiGDO(auth, device_id, directory, store) for device_id in directory.device_ids()]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    memory = sum(stat.size_diff for stat in after.compare_to(before, "filename")) / size
+
+    hub = ws_api.RyobiWebsocketHub(auth)
+    for device in devices:
+        device.connect_ws(hub)
+    start = time.perf_counter()
+    listener = asyncio.ensure_future(hub.listen())
+    await wait_for(lambda: hub.state == ws_api.STATE_CONNECTED)
+    connect = time.perf_counter() - start
+
+    received = []
+    store.subscribe(received.append, {"doorPosition"})
+    device_ids = list(server.devices)
+    start = time.perf_counter()
+    for index in range(NOTIFICATIONS):
+        await server.notify(device_ids[index % size], {"garageDoor_4.doorPosition": index + 1})
+    await wait_for(lambda: len(received) >= NOTIFICATIONS)
+    throughput = NOTIFICATIONS / (time.perf_counter() - start)
+
+    round_trips = []
+    for index in range(COMMANDS):
+        start = time.perf_counter()
+        await hub.send_command(
+            device_ids[index % size], "lightState", "true" if index % 2 else "false", module_type=5, port_id=4
+        )
+        round_trips.append((time.perf_counter() - start) * 1000)
+
+    hub.close()
+    await asyncio.wait_for(listener, 10)
+    await auth.close()
+    await server.stop()
+
+    print(
+        f"{size:>6} devices | connect {connect * 1000:8.1f} ms | "
+        f"{throughput:10,.0f} notifications/s | "
+        f"command p50 {percentile(round_trips, 50):6.2f} ms p99 {percentile(round_trips, 99):6.2f} ms | "
+        f"{memory:8,.0f} B/device"
+    )
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    sizes = [int(size) for size in sys.argv[1:]] or [1, 100, 10000]
+    for size in sizes:
+        asyncio.run(bench(size))
+
+if __name__ == "__main__":
+    main()
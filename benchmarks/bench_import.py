@@ -0,0 +1,57 @@
+"""
+Import time of the package and its entry points, each measured in a fresh
+interpreter, with the transport libraries each import pulled in.
+
+    python benchmarks/bench_import.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MODULES = (
+    "ryobigdopy",
+    "ryobigdopy.http_api",
+    "ryobigdopy.auth",
+    "ryobigdopy.ws_api",
+    "ryobigdopy.ryobigdo",
+    "ryobigdopy.fleet_runner",
+)
+
+TRANSPORTS = ("requests", "urllib3", "aiohttp", "websockets")
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(elapsed, ",".join(name for name in {transports!r} if name in sys.modules))
+"""
+
+def measure(module, runs):
+    samples = []
+    loaded = ""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get("PYTHONPATH")))))
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, transports=TRANSPORTS)],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        samples.append(float(output[0]) * 1000)
+        loaded = output[1] if len(output) > 1 else "-"
+    return statistics.median(samples), loaded
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for module in MODULES:
+        elapsed, loaded = measure(module, runs)
+        print(f"{module:24} {elapsed:8.1f} ms | loads {loaded}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Microbenchmark of the websocket notification path: decode a frame and
+apply it to a RyobiGDO, for every installed JSON backend.
+
+    python benchmarks/bench_ws_decode.py [messages]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")) #Run from a checkout.
+
+from ryobigdopy import ryobigdo
+from ryobigdopy import ws_api
+from ryobigdopy.helpers import json_backend
+
+FRAME = (
+    '{"jsonrpc":"2.0","method":"wskAttributeUpdateNtfy","params":{'
+    '"topic":"abc123.wskAttributeUpdateNtfy","varName":"abc123",'
+    '"garageDoor_7.doorPosition":{"value":4210,"lastValue":4100,"lastSet":1660000000000},'
+    '"garageDoor_7.doorPercentOpen":{"value":37,"lastValue":36,"lastSet":1660000000000},'
+    '"garageDoor_7.doorState":{"value":3,"lastValue":0,"lastSet":1660000000000}}}'
+)
+
+def run(messages):
+    gdo = ryobigdo.RyobiGDO(None, "abc123")
+    process = gdo.process_ws_msg
+    loads = json_backend.loads
+    signal = ws_api.SIGNAL_WEBSOCKET_MESSAGE
+    start = time.perf_counter()
+    for _ in range(messages):
+        process(signal, loads(FRAME))
+    return messages / (time.perf_counter() - start)
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for backend in json_backend.BACKENDS:
+        try:
+            json_backend.set_backend(backend)
+        except ImportError:
+            print(f"{backend:>8}: not installed")
+            continue
+        run(1000) #Warm up and compile the dispatch table.
+        print(f"{backend:>8}: {run(messages):>12,.0f} msg/s per core")
+
+if __name__ == "__main__":
+    main()
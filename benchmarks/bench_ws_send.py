@@ -0,0 +1,116 @@
+"""
+Microbenchmark of the websocket send path: building gdoModuleCommand and
+wskSubscribe frames from dicts on every send versus the cached templates
+in helpers/frames.py, and one send per command versus send_commands.
+The connection is a stub, so only client side cost is measured.
+
+    python benchmarks/bench_ws_send.py [commands]
+"""
+
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")) #Run from a checkout.
+
+from ryobigdopy import ws_api
+from ryobigdopy.helpers import frames
+from ryobigdopy.helpers import json_backend
+
+DEVICES = 1000
+
+class StubConnection:
+    """Accepts frames like a websockets connection, without a socket."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, message):
+        self.sent += len(message)
+
+def build_command(ids, device_id, command, value, module_type, port_id):
+    """Frame a command the way send_command did before templates."""
+    return json_backend.dumps(
+        {'jsonrpc': '2.0',
+        'id': next(ids),
+        'method': 'gdoModuleCommand',
+        'params': {'msgType': 16,
+            'moduleType': module_type,
+            'portId': port_id,
+            'moduleMsg':
+                {command: value},
+            'topic': device_id}
+        })
+
+def build_subscribe(ids, device_id):
+    return json_backend.dumps(
+        {'jsonrpc': '2.0',
+        'id': next(ids),
+        'method': 'wskSubscribe',
+        'params': {"topic": ws_api.notify_topic(device_id)}
+        })
+
+def commands(count):
+    return [
+        (f"device{index % DEVICES:05d}", "doorCommand", index % 2, 5, 7)
+        for index in range(count)
+    ]
+
+def per_second(count, started):
+    return count / (time.perf_counter() - started)
+
+def bench_framing(count, report=True):
+    ids = itertools.count(1)
+    batch = commands(count)
+    started = time.perf_counter()
+    for command in batch:
+        build_command(ids, *command)
+    built = per_second(count, started)
+    frames.clear()
+    started = time.perf_counter()
+    for command in batch:
+        frames.frame(next(ids), frames.command_body(*command))
+    templated = per_second(count, started)
+    if report:
+        print(f"  gdoModuleCommand frame: dumps {built:>12,.0f}/s  template {templated:>12,.0f}/s")
+
+    device_ids = [f"device{index:05d}" for index in range(DEVICES)]
+    rounds = max(1, count // DEVICES)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for device_id in device_ids:
+            build_subscribe(ids, device_id)
+    built = per_second(rounds * DEVICES, started)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for device_id in device_ids:
+            frames.frame(next(ids), frames.subscribe_body(ws_api.notify_topic(device_id)))
+    templated = per_second(rounds * DEVICES, started)
+    if report:
+        print(f"  wskSubscribe frame:     dumps {built:>12,.0f}/s  template {templated:>12,.0f}/s")
+
+async def bench_send(count):
+    ws = ws_api.RyobiWebsocket(lambda *args: None, None)
+    ws.conn = StubConnection()
+    ws.state = ws_api.STATE_CONNECTED
+    batch = commands(count)
+    started = time.perf_counter()
+    for device_id, command, value, module_type, port_id in batch:
+        await ws.send_command(command, value, device_id, None, module_type=module_type, port_id=port_id)
+    single = per_second(count, started)
+    started = time.perf_counter()
+    await ws.send_commands(batch, None)
+    batched = per_second(count, started)
+    print(f"  send path:       send_command {single:>12,.0f}/s  send_commands {batched:>12,.0f}/s")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"JSON backend {json_backend.BACKEND}, {count:,} commands over {DEVICES:,} devices")
+    bench_framing(1000, report=False) #Warm up.
+    bench_framing(count)
+    asyncio.run(bench_send(count))
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,36 @@
-"""Init file for ryobigdopy."""
\ No newline at end of file
+"""
+Init file for ryobigdopy.
+Exports are imported on first access, so importing the package doesn't
+load requests, aiohttp or websockets.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "AccountManager": "accounts",
+    "Auth": "auth",
+    "AsyncAuth": "auth",
+    "FileCredentialCache": "credentials",
+    "DeviceDirectory": "device_directory",
+    "refresh_many": "fleet",
+    "async_refresh_many": "fleet",
+    "FleetRunner": "fleet_runner",
+    "Journal": "journal",
+    "RyobiGDO": "ryobigdo",
+    "StateStore": "state",
+    "RyobiWebsocket": "ws_api",
+    "RyobiWebsocketHub": "ws_api",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
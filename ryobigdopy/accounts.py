@@ -0,0 +1,316 @@
+"""
+Serve many Ryobi accounts from one event loop.
+
+Each account has its own AsyncAuth (and so its own HTTP connection pool),
+RyobiWebsocketHub, command token bucket and supervisor task. A login
+failure, throttling or crash in one account backs off that account only.
+
+    manager = AccountManager(callback=print_event)
+    manager.add_account("customer-1", creds, device_ids)
+    await manager.run()
+"""
+
+import asyncio
+import logging
+import time
+from .auth import AsyncAuth
+from .fleet import REFRESH_CONCURRENCY, async_refresh_many
+from .poller import PollFallback
+from .ryobigdo import RyobiGDO
+from .scheduler import account_bucket
+from .state import StateStore
+from .ws_api import RyobiWebsocketHub
+from .helpers.constants import (
+    HTTP_ENDPOINT,
+    WS_ENDPOINT,
+    ACCOUNT_COMMAND_RATE,
+    ACCOUNT_COMMAND_BURST,
+    ACCOUNT_RESTART_BACKOFF,
+    ACCOUNT_RESTART_MAX,
+    WS_QUEUE_SIZE,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+ACCOUNT_STOPPED = "stopped" #Not started, or stopped with stop().
+ACCOUNT_STARTING = "starting" #Logging in and loading devices.
+ACCOUNT_RUNNING = "running" #Devices loaded, hub listening.
+ACCOUNT_BACKOFF = "backoff" #Failed, waiting before the next start.
+
+class Account:
+    """One account's devices, connections and limits."""
+
+    def __init__(
+        self,
+        name,
+        login_data,
+        device_ids=(),
+        callback=None,
+        http_endpoint=HTTP_ENDPOINT,
+        ws_endpoint=WS_ENDPOINT,
+        credential_cache=None,
+        host_limits=None,
+        command_rate=ACCOUNT_COMMAND_RATE,
+        command_burst=ACCOUNT_COMMAND_BURST,
+        refresh_concurrency=REFRESH_CONCURRENCY,
+        queue_size=WS_QUEUE_SIZE,
+        overflow=None,
+        fields=None,
+        poll=True,
+    ):
+        """
+        :param name: Key of the account in the manager, e.g. a customer id.
+        :param login_data: Account credentials, as for Auth.
+        :param callback: Called with (name, ChangeEvent) for every state change.
+        :param host_limits: Connection pool and retry limits, as for Auth.
+        :param command_rate: Commands per second for all devices of the account.
+        :param command_burst: Commands the account may send at once.
+        :param refresh_concurrency: get_device calls in flight while loading devices.
+        :param fields: Optional projection of the attributes to load, as for RyobiGDO.
+        :param poll: Poll over HTTP while the account's websocket is down.
+        """
+        self.name = name
+        self.callback = callback
+        self.auth = AsyncAuth(
+            login_data,
+            host_limits=host_limits,
+            http_endpoint=http_endpoint,
+            ws_endpoint=ws_endpoint,
+            credential_cache=credential_cache,
+        )
+        self.bucket = account_bucket(self.auth, command_rate, command_burst)
+        self.refresh_concurrency = refresh_concurrency
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.fields = fields
+        self.poll = poll
+        self.device_ids = list(dict.fromkeys(device_ids))
+        self.devices = {} #device_id: RyobiGDO
+        self.store = StateStore()
+        self.store.subscribe(self.collect)
+        self.hub = None
+        self.poller = None
+        self.state = ACCOUNT_STOPPED
+        self.failures = 0
+        self.restarts = 0
+        self.last_error = None
+        self.running_since = None
+        self.events = 0
+        self.commands = 0
+        self._stopped = None
+
+    def collect(self, event):
+        self.events += 1
+        if self.callback is not None:
+            self.callback(self.name, event)
+
+    async def run(self):
+        """Keep the account running until stop(), backing off after failures."""
+        self._stopped = asyncio.Event()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    await self.session()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error: #Contained here, other accounts keep running.
+                    self.failures += 1
+                    self.last_error = error
+                    self.state = ACCOUNT_BACKOFF
+                    delay = min(ACCOUNT_RESTART_MAX, ACCOUNT_RESTART_BACKOFF * 2 ** (self.failures - 1))
+                    _LOGGER.warning("Account %s failed: %r, restarting in %.1fs.", self.name, error, delay)
+                    try:
+                        await asyncio.wait_for(self._stopped.wait(), delay)
+                    except asyncio.TimeoutError:
+                        self.restarts += 1
+        finally:
+            self.state = ACCOUNT_STOPPED
+            self.running_since = None
+            for device in self.devices.values():
+                device.cancel_commands()
+            await self.auth.close()
+
+    async def session(self):
+        """Log in, load devices and listen until stop() or the hub fails."""
+        self.state = ACCOUNT_STARTING
+        if self.auth.api_key is None:
+            await self.auth.login()
+        self.hub = RyobiWebsocketHub(self.auth, self.queue_size, self.overflow)
+        for device in self.devices.values(): #Devices of an earlier session move to the new hub.
+            device.connect_ws(self.hub)
+        listener = None
+        stopped = asyncio.ensure_future(self._stopped.wait())
+        polling = None
+        try:
+            await self.add(self.device_ids) #Registered first, so the connect subscribes them in one batch.
+            listener = asyncio.ensure_future(self.hub.listen())
+            if self.poll:
+                self.poller = PollFallback(self.devices.values(), self.hub)
+                polling = asyncio.ensure_future(self.poller.run())
+            self.state = ACCOUNT_RUNNING
+            self.failures = 0
+            self.running_since = time.time()
+            await asyncio.wait((listener, stopped), return_when=asyncio.FIRST_COMPLETED)
+            if listener.done():
+                listener.result() #Raises what stopped the hub.
+                raise ConnectionError(f"Websocket of {self.name} stopped.")
+        finally:
+            if polling is not None:
+                self.poller.stop()
+                polling.cancel()
+            stopped.cancel()
+            self.hub.close()
+            if listener is not None:
+                await asyncio.gather(listener, return_exceptions=True)
+            self.running_since = None
+
+    async def add(self, device_ids):
+        """Load and connect devices not yet in the account. Failed loads are retried by polling."""
+        for device_id in device_ids:
+            if device_id not in self.device_ids:
+                self.device_ids.append(device_id)
+        devices = [
+            RyobiGDO(self.auth, device_id, store=self.store, fields=self.fields)
+            for device_id in self.device_ids if device_id not in self.devices
+        ]
+        if not devices:
+            return
+        results = await async_refresh_many(devices, self.refresh_concurrency)
+        for device in devices:
+            if not results[device.device_id].ok:
+                _LOGGER.warning("Account %s could not load %s: %r", self.name, device.device_id, results[device.device_id].error)
+            self.devices[device.device_id] = device
+            device.connect_ws(self.hub)
+        if self.poller is not None:
+            self.poller.devices = list(self.devices.values())
+
+    def add_devices(self, device_ids):
+        """Add devices, loading them now if the account is running."""
+        if self.state is ACCOUNT_RUNNING:
+            return asyncio.ensure_future(self.add(device_ids))
+        for device_id in device_ids:
+            if device_id not in self.device_ids:
+                self.device_ids.append(device_id)
+        return None
+
+    def remove_devices(self, device_ids):
+        for device_id in device_ids:
+            if device_id in self.device_ids:
+                self.device_ids.remove(device_id)
+            device = self.devices.pop(device_id, None)
+            if device is not None:
+                device.cancel_commands()
+                if device.hub is not None:
+                    device.close_ws()
+        if self.poller is not None:
+            self.poller.devices = list(self.devices.values())
+
+    async def command(self, device_id, command, value, module=None):
+        """Send a command to one of the account's devices, within the account's rate limit."""
+        self.commands += 1
+        return await self.devices[device_id].send_command(command, value, module)
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def stats(self):
+        """Return the resources and health of the account."""
+        session = self.auth.session
+        return {
+            "state": self.state,
+            "devices": len(self.devices),
+            "websocket": None if self.hub is None else self.hub.state,
+            "queue": None if self.hub is None else self.hub.ws.queue_stats(),
+            "polling": self.poller is not None and self.poller.active,
+            "http_session": session is not None and not session.closed,
+            "command_tokens": round(self.bucket.tokens, 2),
+            "pending_commands": sum(len(device.pending) for device in self.devices.values()),
+            "events": self.events,
+            "commands": self.commands,
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "last_error": None if self.last_error is None else repr(self.last_error),
+            "uptime": None if self.running_since is None else time.time() - self.running_since,
+        }
+
+class AccountManager:
+    """Runs and supervises many Accounts on the running event loop."""
+
+    def __init__(self, callback=None, **defaults):
+        """
+        :param callback: Called with (account name, ChangeEvent) for every state change.
+        :param defaults: Account keyword arguments applied to every account,
+                         e.g. http_endpoint or credential_cache.
+        """
+        self.callback = callback
+        self.defaults = defaults
+        self.accounts = {} #name: Account
+        self.tasks = {} #name: task running the account
+        self._stopped = None
+
+    def __getitem__(self, name):
+        return self.accounts[name]
+
+    def __contains__(self, name):
+        return name in self.accounts
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def add_account(self, name, login_data, device_ids=(), **options):
+        """
+        Add an account, starting it if the manager is running.
+        :param options: Account keyword arguments overriding the defaults.
+        :raises AccountError: name is already in use.
+        """
+        if name in self.accounts:
+            raise AccountError(f"Account {name} already exists.")
+        account = Account(name, login_data, device_ids, callback=self.callback, **{**self.defaults, **options})
+        self.accounts[name] = account
+        if self._stopped is not None and not self._stopped.is_set():
+            self.tasks[name] = asyncio.ensure_future(account.run())
+        return account
+
+    async def remove_account(self, name):
+        """Stop an account and wait for its connections to close."""
+        account = self.accounts.pop(name)
+        account.stop()
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            if account._stopped is None:
+                task.cancel() #Not started yet, nothing to stop gracefully.
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def command(self, name, device_id, command, value, module=None):
+        return await self.accounts[name].command(device_id, command, value, module)
+
+    def start(self):
+        """Start every account on the running loop."""
+        self._stopped = asyncio.Event()
+        for name, account in self.accounts.items():
+            if name not in self.tasks:
+                self.tasks[name] = asyncio.ensure_future(account.run())
+
+    async def run(self):
+        """Run every account until stop()."""
+        self.start()
+        await self._stopped.wait()
+        for account in self.accounts.values():
+            account.stop()
+        tasks, self.tasks = self.tasks, {}
+        for name, result in zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)):
+            if isinstance(result, Exception):
+                _LOGGER.error("Account %s stopped with %r", name, result)
+
+    def stop(self):
+        """Ask run() to stop every account."""
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def stats(self):
+        """Return {account name: Account.stats()}."""
+        return {name: account.stats() for name, account in self.accounts.items()}
+
+class AccountError(Exception):
+    """Class to throw when an account can't be added."""
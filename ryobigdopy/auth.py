@@ -1,11 +1,14 @@
 import logging
-import http_api
+import time
+from . import http_api
+from . import metrics
 from functools import partial
-from requests import Session
-from helpers.constants import (
+from urllib.parse import urlparse
+from .helpers.constants import (
     HTTP_ENDPOINT,
     WS_ENDPOINT,
     HTTP_TIMEOUT,
+    HTTP_POOL_MAXSIZE,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -14,7 +17,24 @@ _LOGGER = logging.getLogger(__name__)
 class Auth:
     """Class to handle login communication."""
 
-    def __init__(self, login_data=None):
+    def __init__(
+        self,
+        login_data=None,
+        host_limits=None,
+        http_endpoint=HTTP_ENDPOINT,
+        ws_endpoint=WS_ENDPOINT,
+        credential_cache=None,
+    ):
+        """
+        :param login_data: Dictionary with username, password and/or api_key.
+        :param host_limits: Optional {host: {pool_maxsize, retries, backoff_factor}}
+                            to tune the connection pool and retries per host.
+        :param http_endpoint: Base of the HTTP API, e.g. a local mock server.
+        :param ws_endpoint: Websocket endpoint.
+        :param credential_cache: Optional credentials.CredentialCache. A cached
+                                 API key is used without logging in and is
+                                 only replaced once the server rejects it.
+        """
 
         if login_data is None:
             login_data = {}
@@ -22,6 +42,14 @@ class Auth:
         self.username = login_data.get("username", None)
         self.password = login_data.get("password", None)
         self.api_key = login_data.get("api_key", None)
+        self.credential_cache = credential_cache
+        self._rejected_key = None
+        if self.api_key is None and credential_cache is not None:
+            self.api_key = credential_cache.get(self.username)
+        self.http_endpoint = http_endpoint
+        self.ws_endpoint = ws_endpoint
+        self.host = urlparse(http_endpoint).netloc
+        self.host_limits = {self.host: {}} if host_limits is None else host_limits
 
         self.login_response = None
         self.is_errored = False
@@ -30,23 +58,77 @@ class Auth:
 
     def create_session(self):
         """Create a session for communication."""
+        from requests import Session
+        from .http_adapter import create_adapter
         s = Session()
         s.get = partial(s.get, timeout=HTTP_TIMEOUT)
+        for host, limits in self.host_limits.items():
+            adapter = create_adapter(**limits)
+            s.mount(f"https://{host}", adapter)
+            s.mount(f"http://{host}", adapter)
         return s
 
-    def login(self, login_url=f"{HTTP_ENDPOINT}/login"):
-        """Attempt login to ryobigdo servers."""
+    def login(self, login_url=None):
+        """
+        Attempt login to ryobigdo servers.
+        With a credential cache, a usable cached API key is taken instead and
+        the cached login payload is returned. Only one process logs in at a
+        time for a username.
+        """
+        if self.credential_cache is None:
+            return self.request_login(login_url)
+        lock = self.credential_cache.lock(self.username)
+        with lock:
+            if self.use_cached_key():
+                return self.login_response
+            login_response = self.request_login(login_url)
+            self.store_key()
+            return login_response
+
+    def use_cached_key(self):
+        """Take the cached API key if there is one that wasn't rejected."""
+        cached = self.credential_cache.get(self.username)
+        if cached is None or cached == self._rejected_key:
+            return False
+        _LOGGER.debug("Using cached API key.")
+        self.api_key = cached
+        self.login_response = self.credential_cache.get_login_response(self.username)
+        if self.login_response is None or self.login_response.get("result", {}).get("auth", {}).get("apiKey") != cached:
+            self.login_response = {"result": {"auth": {"apiKey": cached}}} #Cache without the payload.
+        return True
+
+    def store_key(self):
+        """Put the API key and login payload from a login in the cache."""
+        self.credential_cache.set(self.username, self.api_key)
+        self.credential_cache.set_login_response(self.username, self.login_response)
+
+    def reject_api_key(self):
+        """Mark the current API key as rejected by the server so login() replaces it."""
+        self._rejected_key = self.api_key
+        if self.credential_cache is not None and self.api_key is not None:
+            #Not under the lock so the event loop never waits on another process's login.
+            #Losing the race only deletes a fresh key, which costs one extra login.
+            self.credential_cache.invalidate(self.username, self.api_key)
+
+    def request_login(self, login_url=None):
+        """POST the credentials to the login endpoint."""
+        if login_url is None:
+            login_url = f"{self.http_endpoint}/login"
         _LOGGER.info("Attempting login with %s", login_url)
-        response = http_api.request_login(
-            self,
-            login_url,
-            self.data,
-        )
+        with metrics.span("ryobigdo.login"):
+            started = time.perf_counter()
+            response = http_api.request_login(
+                self,
+                login_url,
+                self.data,
+            )
+            if metrics.ENABLED:
+                metrics.LOGIN_SECONDS.observe(time.perf_counter() - started)
         try:
             if response.status_code == 200:
                 self.login_response = response.json()
                 self.extract_info_from_login()
-                return response.json()
+                return self.login_response
             raise LoginError
         except AttributeError as error:
             raise LoginError from error
@@ -55,5 +137,98 @@ class Auth:
         """Extract login info from login response."""
         self.api_key = self.login_response["result"]["auth"]["apiKey"]
 
+class AsyncAuth(Auth):
+    """Class to handle login communication on an asyncio event loop."""
+
+    def create_session(self):
+        """Session is created on first use, inside the running loop."""
+        self._host_slots = {} #host: semaphore sized by its pool_maxsize
+        return None
+
+    def host_slot(self, host):
+        """Return the semaphore keeping requests to host within its pool_maxsize."""
+        slot = self._host_slots.get(host)
+        if slot is None:
+            import asyncio
+            maxsize = self.host_limits.get(host, {}).get("pool_maxsize", HTTP_POOL_MAXSIZE)
+            slot = self._host_slots[host] = asyncio.Semaphore(maxsize)
+        return slot
+
+    async def get_session(self):
+        """
+        Return the aiohttp session, creating it if needed. The connector
+        allows the largest pool_maxsize per host, host_slot() the host's own.
+        """
+        if self.session is None or self.session.closed:
+            self._host_slots = {} #Semaphores of an earlier session may belong to another loop.
+            limit_per_host = max(
+                (limits.get("pool_maxsize", HTTP_POOL_MAXSIZE) for limits in self.host_limits.values()),
+                default=HTTP_POOL_MAXSIZE,
+            )
+            import aiohttp
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=limit_per_host),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            )
+        return self.session
+
+    async def login(self, login_url=None):
+        """
+        Attempt login to ryobigdo servers.
+        With a credential cache, a usable cached API key is taken instead and
+        the cached login payload is returned. Only one process logs in at a
+        time for a username.
+        """
+        if self.credential_cache is None:
+            return await self.request_login(login_url)
+        import asyncio
+        lock = self.credential_cache.lock(self.username)
+        acquired = asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            #The thread may still get the lock after we stop waiting, hand it back then.
+            acquired.add_done_callback(
+                lambda future: lock.release() if not future.cancelled() and future.exception() is None else None
+            )
+            raise
+        try:
+            if self.use_cached_key():
+                return self.login_response
+            login_response = await self.request_login(login_url)
+            self.store_key()
+            return login_response
+        finally:
+            lock.release()
+
+    async def request_login(self, login_url=None):
+        """POST the credentials to the login endpoint."""
+        if login_url is None:
+            login_url = f"{self.http_endpoint}/login"
+        _LOGGER.info("Attempting login with %s", login_url)
+        with metrics.span("ryobigdo.login"):
+            started = time.perf_counter()
+            response = await http_api.async_request_login(
+                self,
+                login_url,
+                self.data,
+            )
+            if metrics.ENABLED:
+                metrics.LOGIN_SECONDS.observe(time.perf_counter() - started)
+        try:
+            if response.status == 200:
+                self.login_response = await response.json(content_type=None)
+                self.extract_info_from_login()
+                return self.login_response
+            raise LoginError
+        except AttributeError as error:
+            raise LoginError from error
+
+    async def close(self):
+        """Close the aiohttp session."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
 class LoginError(Exception):
     """Class to throw failed login exception."""
\ No newline at end of file
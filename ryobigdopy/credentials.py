@@ -0,0 +1,155 @@
+"""API key caches so workers can skip /api/login on startup."""
+
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: #Not available on Windows, file locking is then per process only.
+    fcntl = None
+
+_LOGGER = logging.getLogger(__name__)
+
+class CredentialCache:
+    """
+    Base class for API key caches. Subclass and override get/set/delete
+    (and lock for sharing between processes) to plug in another store.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        """Return the cached API key for username, or None."""
+        return None
+
+    def set(self, username, api_key):
+        pass
+
+    def delete(self, username):
+        pass
+
+    def get_login_response(self, username):
+        """Return the login payload stored with the API key, or None."""
+        return None
+
+    def set_login_response(self, username, login_response):
+        pass
+
+    def lock(self, username):
+        """Return a lock held while one caller refreshes the key for username."""
+        return self._lock
+
+    def invalidate(self, username, api_key):
+        """Forget api_key, unless the cache already holds a newer one."""
+        if self.get(username) == api_key:
+            self.delete(username)
+
+class MemoryCredentialCache(CredentialCache):
+    """Cache shared by the Auth objects of one process."""
+
+    def __init__(self):
+        super().__init__()
+        self._keys = {}
+        self._responses = {}
+
+    def get(self, username):
+        return self._keys.get(username)
+
+    def set(self, username, api_key):
+        self._keys[username] = api_key
+
+    def get_login_response(self, username):
+        return self._responses.get(username)
+
+    def set_login_response(self, username, login_response):
+        self._responses[username] = login_response
+
+    def delete(self, username):
+        self._keys.pop(username, None)
+        self._responses.pop(username, None)
+
+class FileLock:
+    """Exclusive lock on a file, shared by every process on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        self._file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class FileCredentialCache(CredentialCache):
+    """
+    API keys in a json file readable only by the current user. Writes are
+    atomic and login is single-flight across processes through a lock file.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._file_lock = FileLock(f"{path}.lock")
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            _LOGGER.warning("Ignoring unreadable credential cache %s", self.path)
+            return {}
+
+    def _write(self, data):
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.path)
+
+    def get(self, username):
+        entry = self._read().get(username)
+        return None if entry is None else entry.get("api_key")
+
+    def set(self, username, api_key):
+        data = self._read()
+        data[username] = {"api_key": api_key, "stored_at": time.time()}
+        self._write(data)
+
+    def delete(self, username):
+        data = self._read()
+        if data.pop(username, None) is not None:
+            self._write(data)
+
+    def get_login_response(self, username):
+        return self._read().get(username, {}).get("login_response")
+
+    def set_login_response(self, username, login_response):
+        data = self._read()
+        if username in data:
+            data[username]["login_response"] = login_response
+            self._write(data)
+
+    def lock(self, username):
+        return self._file_lock
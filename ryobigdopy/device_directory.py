@@ -0,0 +1,187 @@
+"""Cache of device payloads shared between RyobiGDO objects."""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from . import http_api
+from .helpers.constants import DIRECTORY_TTL, DIRECTORY_MAX_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeviceDirectory:
+    """
+    Device payloads keyed by device id, with a TTL and LRU eviction.
+    One get_devices call fills the directory for the whole account and
+    later refreshes only refetch the entries that went stale.
+    """
+
+    def __init__(self, ttl=DIRECTORY_TTL, max_size=DIRECTORY_MAX_SIZE, path=None):
+        """
+        :param ttl: Seconds an entry stays fresh.
+        :param max_size: Entries kept before the least recently used is dropped.
+        :param path: Optional json file to persist the directory to.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = path
+        self.etag = None
+        self._entries = OrderedDict() #device_id: (fetched_at, entry)
+
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def __contains__(self, device_id):
+        return device_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, device_id, entry, fetched_at=None):
+        """
+        Store a device payload (one item of a response's result list).
+        Evicting an entry drops the ETag, the directory no longer holds
+        everything it stands for. Returns True if an entry was evicted.
+        """
+        self._entries[device_id] = (time.time() if fetched_at is None else fetched_at, entry)
+        self._entries.move_to_end(device_id)
+        evicted = False
+        while len(self._entries) > self.max_size:
+            evicted_id, _ = self._entries.popitem(last=False)
+            _LOGGER.debug("Evicted %s from device directory.", evicted_id)
+            evicted = True
+        if evicted:
+            self.etag = None
+        return evicted
+
+    def get(self, device_id, allow_stale=False):
+        """Return the cached payload for device_id, or None if missing or stale."""
+        cached = self._entries.get(device_id)
+        if cached is None:
+            return None
+        if not allow_stale and self.is_stale(device_id):
+            return None
+        self._entries.move_to_end(device_id)
+        return cached[1]
+
+    def is_stale(self, device_id):
+        cached = self._entries.get(device_id)
+        return cached is None or time.time() - cached[0] > self.ttl
+
+    def stale_ids(self):
+        return [device_id for device_id in self._entries if self.is_stale(device_id)]
+
+    def device_ids(self):
+        return list(self._entries)
+
+    def summary(self):
+        """Return Name/ID/Description/DeviceTypes/LastSeen for every device."""
+        return http_api.parse_devices(
+            {"result": [entry for _, entry in self._entries.values()]}
+        )
+
+    def update(self, devices_response, etag=None):
+        """
+        Store every entry of a get_devices/get_device json response.
+        etag is only kept if the whole response fit in the directory.
+        """
+        evicted = False
+        for entry in devices_response.get("result", []):
+            evicted = self.put(entry["varName"], entry) or evicted
+        if etag is not None and not evicted:
+            self.etag = etag
+
+    def touch(self):
+        """Mark every entry fresh, after the server said nothing changed."""
+        now = time.time()
+        for device_id, (_, entry) in self._entries.items():
+            self._entries[device_id] = (now, entry)
+
+    def refresh(self, auth):
+        """Refresh the whole account in one get_devices call, conditional on ETag."""
+        response = http_api.get_devices(auth, etag=self.etag if len(self) else None)
+        try:
+            if response.status_code == 304:
+                _LOGGER.debug("Device directory not modified.")
+                self.touch()
+            elif response.status_code == 200:
+                self.update(response.json(), response.headers.get("ETag"))
+            else:
+                raise DirectoryRefreshError(response.status_code)
+        except AttributeError as error:
+            raise DirectoryRefreshError from error
+        self.save()
+        return True
+
+    def refresh_stale(self, auth):
+        """Refetch only the stale entries. Returns the ids that were refreshed."""
+        refreshed = []
+        for device_id in self.stale_ids():
+            response = http_api.get_device(auth, device_id)
+            if getattr(response, "status_code", None) != 200:
+                _LOGGER.warning("Could not refresh %s in device directory.", device_id)
+                continue
+            self.put(device_id, response.json()["result"][0])
+            refreshed.append(device_id)
+        self.save()
+        return refreshed
+
+    async def async_refresh(self, auth):
+        """Refresh the whole account in one get_devices call, conditional on ETag."""
+        response = await http_api.async_get_devices(auth, etag=self.etag if len(self) else None)
+        try:
+            if response.status == 304:
+                _LOGGER.debug("Device directory not modified.")
+                self.touch()
+            elif response.status == 200:
+                self.update(await response.json(content_type=None), response.headers.get("ETag"))
+            else:
+                raise DirectoryRefreshError(response.status)
+        except AttributeError as error:
+            raise DirectoryRefreshError from error
+        self.save()
+        return True
+
+    async def async_refresh_stale(self, auth):
+        """Refetch only the stale entries. Returns the ids that were refreshed."""
+        refreshed = []
+        for device_id in self.stale_ids():
+            response = await http_api.async_get_device(auth, device_id)
+            if getattr(response, "status", None) != 200:
+                _LOGGER.warning("Could not refresh %s in device directory.", device_id)
+                continue
+            self.put(device_id, (await response.json(content_type=None))["result"][0])
+            refreshed.append(device_id)
+        self.save()
+        return refreshed
+
+    def save(self):
+        """Write the directory to path, if one was given."""
+        if self.path is None:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {
+                    "etag": self.etag,
+                    "entries": [
+                        [device_id, fetched_at, entry]
+                        for device_id, (fetched_at, entry) in self._entries.items()
+                    ],
+                },
+                file,
+            )
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Read the directory from path, keeping the original fetch times."""
+        with open(self.path) as file:
+            data = json.load(file)
+        self.etag = data.get("etag")
+        for device_id, fetched_at, entry in data.get("entries", []):
+            self.put(device_id, entry, fetched_at)
+
+class DirectoryRefreshError(Exception):
+    """Class to throw failed device directory refresh exception."""
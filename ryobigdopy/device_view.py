@@ -0,0 +1,135 @@
+"""
+Lazy view of one device entry of a get_device/get_devices payload.
+Nothing is copied out of the decoded JSON until it is read, and an
+optional field projection limits which module attributes are loaded.
+"""
+
+from .models import BINDING, split_key #BINDING is kept by any projection so commands can still be addressed.
+
+class Projection:
+    """
+    The module attributes a caller wants, e.g. Projection(("doorState",)).
+    Fields are "attribute" for that attribute of any module, or
+    "module.attribute" for one module, e.g. "garageLight.lightState".
+    """
+
+    __slots__ = ("fields", "attributes", "by_module", "_names")
+
+    def __init__(self, fields):
+        self.fields = frozenset(fields)
+        self.attributes = frozenset(field for field in self.fields if "." not in field)
+        self.by_module = {}
+        for field in self.fields - self.attributes:
+            module, _, attribute = field.partition(".")
+            self.by_module.setdefault(module, set()).add(attribute)
+        self._names = {} #Module name: attribute names to keep
+
+    def names(self, module):
+        """Return the attribute names kept for a module name, e.g. "garageDoor"."""
+        names = self._names.get(module)
+        if names is None:
+            names = self._names[module] = tuple(self.attributes | self.by_module.get(module, set()))
+        return names
+
+    def select(self, module, attributes):
+        """Return the kept part of a module's "at" dict, or None if nothing is kept."""
+        selected = {name: attributes[name] for name in self.names(module) if name in attributes}
+        if not selected:
+            return None
+        for name in BINDING:
+            if name in attributes:
+                selected[name] = attributes[name]
+        return selected
+
+_PROJECTIONS = {}
+
+def projection(fields):
+    """Return the shared Projection for fields so devices don't each keep a copy. None for every field."""
+    if fields is None or isinstance(fields, Projection):
+        return fields
+    key = frozenset(fields)
+    view = _PROJECTIONS.get(key)
+    if view is None:
+        view = _PROJECTIONS[key] = Projection(key)
+    return view
+
+class DeviceView:
+    """Read access to a device entry, decoded once and materialized on access."""
+
+    __slots__ = ("entry", "fields")
+
+    def __init__(self, entry, fields=None):
+        """
+        :param entry: One item of the "result" list of a device payload.
+        :param fields: Optional projection, see Projection.
+        """
+        self.entry = entry
+        self.fields = projection(fields)
+
+    @classmethod
+    def from_response(cls, device_response, fields=None):
+        """View the first result of a get_device payload."""
+        return cls(device_response["result"][0], fields)
+
+    @property
+    def device_id(self):
+        return self.entry.get("varName")
+
+    @property
+    def meta(self):
+        return self.entry.get("metaData") or {}
+
+    @property
+    def name(self):
+        return self.meta.get("name")
+
+    @property
+    def description(self):
+        return self.meta.get("description")
+
+    @property
+    def version(self):
+        return self.meta.get("version")
+
+    @property
+    def lastSeen(self):
+        return (self.meta.get("sys") or {}).get("lastSeen")
+
+    @property
+    def has_modules(self):
+        return "deviceTypeMap" in self.entry
+
+    def modules(self):
+        """Yield (deviceTypeMap key, "at" dict) of every module the projection keeps."""
+        fields = self.fields
+        for key, module in self.entry.get("deviceTypeMap", {}).items():
+            attributes = module.get("at", {})
+            if fields is not None:
+                attributes = fields.select(split_key(key)[0], attributes)
+                if attributes is None:
+                    continue
+            yield key, attributes
+
+    def module(self, key):
+        """Return the "at" dict of a module key (e.g. garageDoor_7) or name (garageDoor)."""
+        deviceTypeMap = self.entry.get("deviceTypeMap", {})
+        module = deviceTypeMap.get(key)
+        if module is None:
+            module = next((module for name, module in deviceTypeMap.items() if split_key(name)[0] == key), None)
+        if module is None:
+            return None
+        attributes = module.get("at", {})
+        if self.fields is not None:
+            return self.fields.select(split_key(key)[0], attributes)
+        return attributes
+
+    def attribute(self, field):
+        """Return the API attribute dict for "module.attribute", e.g. "garageDoor.doorState"."""
+        key, _, name = field.partition(".")
+        attributes = self.module(key)
+        return None if attributes is None else attributes.get(name)
+
+    def value(self, field, default=None):
+        """Return the value of "module.attribute", without loading anything else."""
+        attribute = self.attribute(field)
+        return default if attribute is None else attribute.get("value", default)
@@ -0,0 +1,145 @@
+"""Bulk operations over many RyobiGDO objects."""
+
+import asyncio
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from . import http_api
+from .helpers import json_backend
+
+_LOGGER = logging.getLogger(__name__)
+
+REFRESH_CONCURRENCY = 10
+
+RefreshResult = namedtuple("RefreshResult", "device_id ok source error")
+RefreshResult.__doc__ = """
+Outcome of refreshing one device. source is "account" when the
+device came from the account wide get_devices payload, "device" when
+it needed its own get_device call.
+"""
+
+def _by_account(devices):
+    accounts = {}
+    for device in devices:
+        accounts.setdefault(id(device.auth), []).append(device)
+    return accounts.values()
+
+def _apply_account(devices, devices_response, results):
+    """Load every device found with full state in the payload. Returns the rest."""
+    entries = {entry.get("varName"): entry for entry in devices_response.get("result", [])}
+    remaining = []
+    for device in devices:
+        entry = entries.get(device.device_id)
+        if entry is None or "deviceTypeMap" not in entry:
+            remaining.append(device)
+            continue
+        try:
+            device.load_entry(entry)
+            results[device.device_id] = RefreshResult(device.device_id, True, "account", None)
+        except Exception as error:
+            results[device.device_id] = RefreshResult(device.device_id, False, "account", error)
+    return remaining
+
+def refresh_many(devices, concurrency=REFRESH_CONCURRENCY):
+    """
+    Refresh many devices without stopping on the first failure.
+    Each account is fetched with one get_devices call. Devices missing from
+    that payload are fetched with get_device on a thread pool. Payloads are
+    applied on the calling thread, so devices and their StateStore are
+    never changed from several threads at once.
+    :return: Dict of device_id to RefreshResult.
+    """
+    devices = list(devices)
+    return apply_many(devices, fetch_many(devices, concurrency))
+
+def fetch_many(devices, concurrency=REFRESH_CONCURRENCY, per_device=False):
+    """
+    Fetch payloads like refresh_many without applying them, so it can run
+    off the event loop thread. Apply the result with apply_many.
+    :param per_device: Skip the account wide get_devices call.
+    :return: ({device_id: (source, entry)}, {device_id: failed RefreshResult})
+    """
+    entries = {}
+    failures = {}
+    remaining = list(devices) if per_device else []
+    for devices_of_account in () if per_device else _by_account(devices):
+        try:
+            response = http_api.get_devices(devices_of_account[0].auth)
+            if response.status_code != 200:
+                raise http_api.RyobiBadResponse(response.status_code)
+            payload = {entry.get("varName"): entry for entry in json_backend.loads(response.content).get("result", [])}
+            for device in devices_of_account:
+                entry = payload.get(device.device_id)
+                if entry is None or "deviceTypeMap" not in entry:
+                    remaining.append(device)
+                else:
+                    entries[device.device_id] = ("account", entry)
+        except Exception as error:
+            _LOGGER.warning("Account fetch failed, falling back to per device: %r", error)
+            remaining.extend(devices_of_account)
+
+    def fetch(device):
+        try:
+            response = http_api.get_device(device.auth, device.device_id)
+            if response.status_code != 200:
+                raise http_api.RyobiBadResponse(response.status_code)
+            return device.device_id, json_backend.loads(response.content)["result"][0], None
+        except Exception as error:
+            return device.device_id, None, error
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for device_id, entry, error in executor.map(fetch, remaining):
+            if error is None:
+                entries[device_id] = ("device", entry)
+            else:
+                failures[device_id] = RefreshResult(device_id, False, "device", error)
+    return entries, failures
+
+def apply_many(devices, fetched):
+    """
+    Load the entries of fetch_many into devices, on the thread owning them.
+    :return: Dict of device_id to RefreshResult.
+    """
+    entries, results = fetched[0], dict(fetched[1])
+    for device in devices:
+        if device.device_id not in entries:
+            continue
+        source, entry = entries[device.device_id]
+        try:
+            device.load_entry(entry)
+            results[device.device_id] = RefreshResult(device.device_id, True, source, None)
+        except Exception as error:
+            results[device.device_id] = RefreshResult(device.device_id, False, source, error)
+    return results
+
+async def async_refresh_many(devices, concurrency=REFRESH_CONCURRENCY):
+    """
+    Refresh many devices on the event loop, concurrency at a time.
+    Same strategy and results as refresh_many.
+    """
+    results = {}
+    remaining = []
+    for devices_of_account in _by_account(devices):
+        try:
+            response = await http_api.async_get_devices(devices_of_account[0].auth)
+            if response.status != 200:
+                raise http_api.RyobiBadResponse(response.status)
+            devices_response = await response.json(content_type=None, loads=json_backend.loads)
+            remaining.extend(_apply_account(devices_of_account, devices_response, results))
+        except Exception as error:
+            _LOGGER.warning("Account refresh failed, falling back to per device: %r", error)
+            remaining.extend(devices_of_account)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def refresh(device):
+        async with semaphore:
+            try:
+                await device.async_update_device()
+                return RefreshResult(device.device_id, True, "device", None)
+            except Exception as error:
+                return RefreshResult(device.device_id, False, "device", error)
+
+    for result in await asyncio.gather(*(refresh(device) for device in remaining)):
+        results[result.device_id] = result
+    return results
@@ -0,0 +1,355 @@
+"""
+Run a fleet of openers across worker processes.
+
+Device ids are sharded over processes, each with its own event loop,
+AsyncAuth and RyobiWebsocketHub. Workers send state changes to the
+parent in batches over a pipe. The parent restarts crashed shards
+and balances devices between them.
+
+    runner = FleetRunner(creds, shards=4, callback=print_events)
+    runner.start(device_ids)
+    runner.run()
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+from .auth import AsyncAuth
+from .credentials import FileCredentialCache
+from .fleet import async_refresh_many
+from .ryobigdo import RyobiGDO
+from .state import ChangeEvent, StateStore
+from .ws_api import RyobiWebsocketHub
+from .helpers.constants import (
+    HTTP_ENDPOINT,
+    WS_ENDPOINT,
+    SHARD_BATCH_INTERVAL,
+    SHARD_BATCH_SIZE,
+    SHARD_RESTART_BACKOFF,
+    SHARD_RESTART_MAX,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+def run_shard(shard_id, conn, device_ids, config):
+    """Entry point of a worker process."""
+    asyncio.run(ShardWorker(shard_id, conn, **config).run(device_ids))
+
+class ShardWorker:
+    """Devices of one shard, on the event loop of a worker process."""
+
+    def __init__(
+        self,
+        shard_id,
+        conn,
+        login_data,
+        http_endpoint=HTTP_ENDPOINT,
+        ws_endpoint=WS_ENDPOINT,
+        credential_cache_path=None,
+        batch_interval=SHARD_BATCH_INTERVAL,
+        batch_size=SHARD_BATCH_SIZE,
+    ):
+        self.shard_id = shard_id
+        self.conn = conn
+        self.login_data = login_data
+        self.http_endpoint = http_endpoint
+        self.ws_endpoint = ws_endpoint
+        self.credential_cache_path = credential_cache_path
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.devices = {}
+        self.batch = []
+        self.store = StateStore()
+        self.store.subscribe(self.collect)
+        self.auth = None
+        self.hub = None
+        self._stopped = None
+
+    def collect(self, event):
+        self.batch.append(tuple(event))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Send the buffered state changes as one frame."""
+        if self.batch:
+            batch, self.batch = self.batch, []
+            self.conn.send(("events", self.shard_id, batch))
+
+    async def run(self, device_ids):
+        cache = None if self.credential_cache_path is None else FileCredentialCache(self.credential_cache_path)
+        self.auth = AsyncAuth(
+            self.login_data,
+            http_endpoint=self.http_endpoint,
+            ws_endpoint=self.ws_endpoint,
+            credential_cache=cache,
+        )
+        self._stopped = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        try:
+            await self.auth.login()
+            self.hub = RyobiWebsocketHub(self.auth)
+            await self.add(device_ids) #Registered first, so the connect subscribes them in one batch.
+            listener = asyncio.ensure_future(self.hub.listen())
+            loop.add_reader(self.conn.fileno(), self.on_control)
+            self.conn.send(("ready", self.shard_id, len(self.devices)))
+            while not self._stopped.is_set():
+                await asyncio.sleep(self.batch_interval)
+                self.flush()
+            loop.remove_reader(self.conn.fileno())
+            self.hub.close()
+            await listener
+            self.flush()
+        finally:
+            await self.auth.close()
+
+    async def add(self, device_ids):
+        devices = [
+            RyobiGDO(self.auth, device_id, store=self.store)
+            for device_id in device_ids if device_id not in self.devices
+        ]
+        results = await async_refresh_many(devices)
+        for device in devices:
+            if not results[device.device_id].ok:
+                _LOGGER.warning("Shard %s could not load %s: %r", self.shard_id, device.device_id, results[device.device_id].error)
+            self.devices[device.device_id] = device
+            device.connect_ws(self.hub)
+
+    def remove(self, device_ids):
+        for device_id in device_ids:
+            device = self.devices.pop(device_id, None)
+            if device is not None:
+                device.cancel_commands()
+                device.close_ws()
+
+    async def command(self, device_id, command, value, module):
+        try:
+            await self.devices[device_id].send_command(command, value, module)
+        except Exception: #Reported here, the parent doesn't wait for results.
+            _LOGGER.exception("Shard %s failed to send %s to %s", self.shard_id, command, device_id)
+
+    def on_control(self):
+        """Handle messages from the parent: add, remove, command and stop."""
+        try:
+            while self.conn.poll():
+                message = self.conn.recv()
+                kind = message[0]
+                if kind == "add":
+                    asyncio.ensure_future(self.add(message[1]))
+                elif kind == "remove":
+                    self.remove(message[1])
+                elif kind == "command":
+                    asyncio.ensure_future(self.command(*message[1:]))
+                elif kind == "stop":
+                    self._stopped.set()
+        except (EOFError, OSError): #Parent is gone.
+            asyncio.get_event_loop().remove_reader(self.conn.fileno())
+            self._stopped.set()
+
+class Shard:
+    """Parent side view of a worker process."""
+
+    def __init__(self, index):
+        self.index = index
+        self.device_ids = set()
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.failures = 0
+        self.restarts = 0
+        self.restart_at = None
+        self.events = 0
+
+    def send(self, message):
+        if self.conn is not None:
+            try:
+                self.conn.send(message)
+            except OSError: #Worker died, it gets its devices on restart.
+                pass
+
+class FleetRunner:
+    """Supervises shard worker processes and collects their state changes."""
+
+    def __init__(
+        self,
+        login_data,
+        shards=None,
+        callback=None,
+        http_endpoint=HTTP_ENDPOINT,
+        ws_endpoint=WS_ENDPOINT,
+        credential_cache_path=None,
+        batch_interval=SHARD_BATCH_INTERVAL,
+        batch_size=SHARD_BATCH_SIZE,
+    ):
+        """
+        :param login_data: Account credentials, as for Auth.
+        :param shards: Worker processes, one per core by default.
+        :param callback: Called with each batch as a list of ChangeEvents.
+        :param credential_cache_path: Optional FileCredentialCache path so
+                                      shards share one login.
+        """
+        self.callback = callback
+        self.config = {
+            "login_data": login_data,
+            "http_endpoint": http_endpoint,
+            "ws_endpoint": ws_endpoint,
+            "credential_cache_path": credential_cache_path,
+            "batch_interval": batch_interval,
+            "batch_size": batch_size,
+        }
+        self.shards = [Shard(index) for index in range(shards or os.cpu_count() or 1)]
+        self.assignments = {} #device_id: Shard
+        self._context = multiprocessing.get_context("spawn") #No forked event loops.
+        self._running = False
+
+    def start(self, device_ids=()):
+        """Assign devices and start every worker."""
+        self._running = True
+        self.assign(device_ids)
+        for shard in self.shards:
+            self.spawn(shard)
+
+    def spawn(self, shard):
+        parent_conn, child_conn = self._context.Pipe()
+        shard.process = self._context.Process(
+            target=run_shard,
+            args=(shard.index, child_conn, sorted(shard.device_ids), self.config),
+            name=f"ryobigdo-shard-{shard.index}",
+            daemon=True,
+        )
+        shard.process.start()
+        child_conn.close()
+        shard.conn = parent_conn
+        shard.ready = False
+        shard.restart_at = None
+
+    def assign(self, device_ids):
+        """Give each new device to the least loaded shard. Returns {Shard: [device_id]}."""
+        added = {}
+        for device_id in device_ids:
+            if device_id in self.assignments:
+                continue
+            shard = min(self.shards, key=lambda shard: len(shard.device_ids))
+            shard.device_ids.add(device_id)
+            self.assignments[device_id] = shard
+            added.setdefault(shard, []).append(device_id)
+        return added
+
+    def add_devices(self, device_ids):
+        for shard, added in self.assign(device_ids).items():
+            shard.send(("add", added))
+
+    def remove_devices(self, device_ids):
+        removed = {}
+        for device_id in device_ids:
+            shard = self.assignments.pop(device_id, None)
+            if shard is not None:
+                shard.device_ids.discard(device_id)
+                removed.setdefault(shard, []).append(device_id)
+        for shard, device_ids in removed.items():
+            shard.send(("remove", device_ids))
+
+    def rebalance(self):
+        """Move devices from the fullest to the emptiest shards until they differ by at most one."""
+        moves = {} #(source, target): [device_id]
+        while True:
+            source = max(self.shards, key=lambda shard: len(shard.device_ids))
+            target = min(self.shards, key=lambda shard: len(shard.device_ids))
+            if len(source.device_ids) - len(target.device_ids) <= 1:
+                break
+            device_id = source.device_ids.pop()
+            target.device_ids.add(device_id)
+            self.assignments[device_id] = target
+            moves.setdefault((source, target), []).append(device_id)
+        for (source, target), device_ids in moves.items():
+            source.send(("remove", device_ids))
+            target.send(("add", device_ids))
+        return sum(len(device_ids) for device_ids in moves.values())
+
+    def command(self, device_id, command, value, module=None):
+        """Forward a command to the shard owning device_id."""
+        self.assignments[device_id].send(("command", device_id, command, value, module))
+
+    def poll(self, timeout=1.0):
+        """Deliver state changes received within timeout, then restart dead shards."""
+        conns = {shard.conn: shard for shard in self.shards if shard.conn is not None}
+        for conn in wait(list(conns), timeout) if conns else ():
+            shard = conns[conn]
+            try:
+                while conn.poll():
+                    self.handle(shard, conn.recv())
+            except (EOFError, OSError):
+                conn.close()
+                shard.conn = None
+        if not conns:
+            time.sleep(timeout)
+        self.supervise()
+
+    def handle(self, shard, message):
+        kind = message[0]
+        if kind == "events":
+            events = [ChangeEvent(*event) for event in message[2]]
+            shard.events += len(events)
+            if self.callback is not None:
+                self.callback(events)
+        elif kind == "ready":
+            shard.ready = True
+            shard.failures = 0
+            _LOGGER.info("Shard %s ready with %s devices.", shard.index, message[2])
+
+    def supervise(self):
+        """Restart crashed workers with exponential backoff."""
+        now = time.monotonic()
+        for shard in self.shards:
+            if not self._running or shard.process is None or shard.process.is_alive():
+                continue
+            if shard.restart_at is None:
+                shard.failures += 1
+                delay = min(SHARD_RESTART_MAX, SHARD_RESTART_BACKOFF * 2 ** (shard.failures - 1))
+                shard.restart_at = now + delay
+                _LOGGER.warning("Shard %s exited with %s, restarting in %.1fs.", shard.index, shard.process.exitcode, delay)
+                if shard.conn is not None:
+                    shard.conn.close()
+                    shard.conn = None
+            elif now >= shard.restart_at:
+                shard.restarts += 1
+                self.spawn(shard)
+
+    def run(self):
+        """Poll until stop() is called, e.g. from a callback or signal handler."""
+        while self._running:
+            self.poll()
+
+    def stop(self, timeout=10):
+        """Ask every worker to stop, terminating those that don't in time."""
+        self._running = False
+        for shard in self.shards:
+            shard.send(("stop",))
+        deadline = time.monotonic() + timeout
+        for shard in self.shards:
+            if shard.process is None:
+                continue
+            shard.process.join(max(0, deadline - time.monotonic()))
+            if shard.process.is_alive():
+                shard.process.terminate()
+                shard.process.join()
+            if shard.conn is not None:
+                shard.conn.close()
+                shard.conn = None
+
+    def stats(self):
+        """Return per shard device count, liveness, restarts and events received."""
+        return [
+            {
+                "shard": shard.index,
+                "devices": len(shard.device_ids),
+                "alive": shard.process is not None and shard.process.is_alive(),
+                "ready": shard.ready,
+                "restarts": shard.restarts,
+                "events": shard.events,
+            }
+            for shard in self.shards
+        ]
@@ -18,6 +18,37 @@ ONLINE = {"online": True, "offline": False}
 OTHER
 """
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
-MIN_THROTTLE_TIME = 2
+MIN_THROTTLE_TIME = 2 #Seconds between two commands to the same device
+ACCOUNT_COMMAND_RATE = 5 #Commands per second per account
+ACCOUNT_COMMAND_BURST = 10
 HTTP_TIMEOUT = 10
-WS_MAXRETRY = 3
\ No newline at end of file
+HTTP_POOL_CONNECTIONS = 4 #Hosts kept in the pool
+HTTP_POOL_MAXSIZE = 20 #Keep-alive connections per host
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5 #Seconds, doubled each retry before jitter
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+DIRECTORY_TTL = 300 #Seconds a cached device payload stays fresh
+DIRECTORY_MAX_SIZE = 1000
+WS_MAXRETRY = 3 #Consecutive failures before the circuit breaker opens
+WS_BACKOFF_BASE = 1 #Seconds, doubled each consecutive failure
+WS_BACKOFF_MAX = 60
+WS_BREAKER_COOLDOWN = 300 #Seconds between attempts while the breaker is open
+WS_PING_INTERVAL = 20
+WS_PING_TIMEOUT = 20
+WS_QUEUE_SIZE = 1000 #Notifications buffered between socket reader and callbacks
+WS_QUEUE_BACKLOG = 1000 #Notifications held past WS_QUEUE_SIZE by POLICY_BLOCK before the socket reader pauses
+WS_TIMEOUT = 10
+WS_COMMAND_TIMEOUT = 5
+WS_FRAME_CACHE_SIZE = 8192 #Serialized command and subscribe bodies kept for reuse
+JOURNAL_SEGMENT_SIZE = 16 * 1024 * 1024 #Bytes before the journal starts a new segment
+SHARD_BATCH_INTERVAL = 0.05 #Seconds a shard buffers state changes before sending them
+SHARD_BATCH_SIZE = 500 #State changes that make a shard send early
+SHARD_RESTART_BACKOFF = 1 #Seconds, doubled each consecutive shard crash
+SHARD_RESTART_MAX = 60
+ACCOUNT_RESTART_BACKOFF = 1 #Seconds, doubled each consecutive failure of an account
+ACCOUNT_RESTART_MAX = 300
+COMMAND_CONFIRM_TIMEOUT = 15 #Seconds for a notification to confirm a command before rollback
+POLL_GRACE = 10 #Seconds the websocket may be down before HTTP polling starts
+POLL_FAST_INTERVAL = 3 #Seconds between polls of a moving door
+POLL_SLOW_INTERVAL = 60 #Seconds between polls of idle devices
+POLL_JITTER = 0.2 #Fraction by which poll intervals are randomly spread
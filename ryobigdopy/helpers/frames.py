@@ -0,0 +1,62 @@
+"""
+Prebuilt JSON-RPC request frames for the websocket.
+Everything after the request id is serialized once and cached, so sending
+a command or resubscribing a fleet only formats the id into a template.
+"""
+
+from functools import lru_cache
+from . import json_backend
+from .constants import WS_FRAME_CACHE_SIZE
+
+PREFIX = '{"jsonrpc":"2.0","id":'
+
+def frame(request_id, body):
+    """Return the frame of a request from its id and cached body."""
+    return f"{PREFIX}{request_id}{body}"
+
+def body(method, params):
+    """Serialize the part of a request that follows the id."""
+    return f',"method":{json_backend.dumps(method)},"params":{json_backend.dumps(params)}}}'
+
+@lru_cache(maxsize=WS_FRAME_CACHE_SIZE, typed=True) #typed keeps True and 1 apart.
+def _command_body(device_id, command, value, module_type, port_id):
+    return body(
+        "gdoModuleCommand",
+        {'msgType': 16,
+        'moduleType': module_type,
+        'portId': port_id,
+        'moduleMsg':
+            {command: value},
+        'topic': device_id},
+    )
+
+def command_body(device_id, command, value, module_type, port_id):
+    """Return the gdoModuleCommand body for a module command."""
+    try:
+        return _command_body(device_id, command, value, module_type, port_id)
+    except TypeError: #Unhashable value, serialized every time.
+        return _command_body.__wrapped__(device_id, command, value, module_type, port_id)
+
+@lru_cache(maxsize=WS_FRAME_CACHE_SIZE)
+def subscribe_body(topic):
+    """Return the wskSubscribe body for a topic."""
+    return body("wskSubscribe", {"topic": topic})
+
+def auth_body(username, api_key):
+    """
+    Return the srvWebSocketAuth body. Not cached here, so credentials are
+    only kept by the RyobiWebsocket of their account.
+    """
+    return body("srvWebSocketAuth", {'varName': username, 'apiKey': api_key})
+
+def cache_info():
+    """Return lru_cache statistics of each template cache."""
+    return {
+        "gdoModuleCommand": _command_body.cache_info(),
+        "wskSubscribe": subscribe_body.cache_info(),
+    }
+
+def clear():
+    """Drop every cached template, e.g. after switching JSON backend."""
+    _command_body.cache_clear()
+    subscribe_body.cache_clear()
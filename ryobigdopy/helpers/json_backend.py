@@ -0,0 +1,46 @@
+"""Pluggable JSON backend. Uses orjson or msgspec when installed, else stdlib json."""
+
+import json
+
+BACKENDS = ("orjson", "msgspec", "json")
+
+def _load_orjson():
+    import orjson
+    return orjson.loads, lambda obj: orjson.dumps(obj).decode()
+
+def _load_msgspec():
+    import msgspec
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return decoder.decode, lambda obj: encoder.encode(obj).decode()
+
+def _load_json():
+    return json.loads, json.dumps
+
+_LOADERS = {
+    "orjson": _load_orjson,
+    "msgspec": _load_msgspec,
+    "json": _load_json,
+}
+
+BACKEND = None
+loads = json.loads
+dumps = json.dumps #Always returns str so frames go out as websocket text.
+
+def set_backend(name=None):
+    """
+    Select the JSON backend used for websocket frames.
+    :param name: "orjson", "msgspec" or "json". None picks the first installed.
+    :raises ImportError: The named backend is not installed.
+    """
+    global BACKEND, loads, dumps
+    for candidate in BACKENDS if name is None else (name,):
+        try:
+            loads, dumps = _LOADERS[candidate]()
+        except ImportError:
+            continue
+        BACKEND = candidate
+        return BACKEND
+    raise ImportError(f"JSON backend {name} is not installed.")
+
+set_backend()
@@ -0,0 +1,43 @@
+"""requests transport adapter with pooled keep-alive connections and jittered retries."""
+
+import random
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .helpers.constants import (
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+    HTTP_RETRY_STATUSES,
+)
+
+class JitterRetry(Retry):
+    """Retry with full jitter so clients don't retry in lockstep."""
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+def create_adapter(
+    pool_connections=HTTP_POOL_CONNECTIONS,
+    pool_maxsize=HTTP_POOL_MAXSIZE,
+    retries=HTTP_RETRIES,
+    backoff_factor=HTTP_BACKOFF_FACTOR,
+):
+    """
+    Create a keep-alive connection pool adapter that retries 429/5xx.
+    :param pool_connections: Number of host pools to cache.
+    :param pool_maxsize: Connections kept alive per host.
+    :param retries: Retries for connection errors and retryable statuses.
+    :param backoff_factor: Base for the exponential backoff, in seconds.
+    """
+    retry = JitterRetry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        raise_on_status=False, #Hand the last response back to the caller.
+    )
+    return HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+    )
@@ -1,27 +1,90 @@
-"""Implements known ryobigdo HTTP API calls."""
+"""
+Implements known ryobigdo HTTP API calls.
+requests is imported by the sync calls and aiohttp by the async ones,
+on first use, so either transport can be left uninstalled.
+"""
 
 import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from . import metrics
 from json import dumps
-from urllib import response
-from helpers.constants import HTTP_ENDPOINT, RYOBI_URL, HTTP_TIMEOUT
-from requests import Request, exceptions
-from urllib3.util.retry import Retry
+from .helpers.constants import (
+    HTTP_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+    HTTP_RETRY_STATUSES,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
-def get_devices(auth):
-    url = f"{HTTP_ENDPOINT}/devices"
+def backoff_time(attempt, backoff_factor=HTTP_BACKOFF_FACTOR):
+    """Return a full jitter exponential backoff for the given retry attempt."""
+    return random.uniform(0, backoff_factor * (2 ** attempt))
+
+def retry_after(headers):
+    """Return the seconds asked for by a Retry-After header, or None."""
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def endpoint_label(auth, url):
+    """Return the API path of url with device ids replaced, for metrics."""
+    path = url[len(auth.http_endpoint):] if url.startswith(auth.http_endpoint) else url
+    if path.startswith("/devices/"):
+        return "/devices/{id}"
+    return path
+
+def observe_request(auth, url, started, status):
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        endpoint=endpoint_label(auth, url),
+        status=status,
+    )
+
+def parse_devices(devices_response):
+    """Return a dict of device id to Name/ID/Description/DeviceTypes/LastSeen."""
+    devices = {}
+    for entry in devices_response.get("result", []):
+        meta = entry.get("metaData", {})
+        devices[entry["varName"]] = {
+            "name": meta.get("name"),
+            "id": entry["varName"],
+            "description": meta.get("description"),
+            "deviceTypes": entry.get("deviceTypeIds", []),
+            "lastSeen": meta.get("sys", {}).get("lastSeen"),
+        }
+    return devices
+
+def get_devices(auth, etag=None):
+    """
+    Get all devices of the account. Use parse_devices() on the json.
+    :param etag: ETag of a previous response, the server may answer 304.
+    """
+    url = f"{auth.http_endpoint}/devices"
     headers = {
-        "Host": RYOBI_URL,
+        "Host": auth.host,
         "Content-Type": "application/json",
     }
+    if etag is not None:
+        headers["If-None-Match"] = etag
     data = dumps(
         {
             "username": auth.username,
             "password": auth.password,
         }
     )
-    return query( #TODO: Process and return a dict of Name/ID/Description/DeviceTypes/LastSeen
+    return query(
         auth,
         url=url,
         reqtype="get",
@@ -30,9 +93,9 @@ def get_devices(auth):
     )
 
 def get_device(auth, device_id):
-    url = f"{HTTP_ENDPOINT}/devices/{device_id}"
+    url = f"{auth.http_endpoint}/devices/{device_id}"
     headers = {
-        "Host": RYOBI_URL,
+        "Host": auth.host,
         "Content-Type": "application/json",
     }
     data = dumps(
@@ -50,6 +113,48 @@ def get_device(auth, device_id):
         headers=headers
     )
 
+async def async_get_devices(auth, etag=None):
+    url = f"{auth.http_endpoint}/devices"
+    headers = {
+        "Host": auth.host,
+        "Content-Type": "application/json",
+    }
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    data = dumps(
+        {
+            "username": auth.username,
+            "password": auth.password,
+        }
+    )
+    return await async_query(
+        auth,
+        url=url,
+        reqtype="get",
+        data=data,
+        headers=headers
+    )
+
+async def async_get_device(auth, device_id):
+    url = f"{auth.http_endpoint}/devices/{device_id}"
+    headers = {
+        "Host": auth.host,
+        "Content-Type": "application/json",
+    }
+    data = dumps(
+        {
+            "username": auth.username,
+            "password": auth.password,
+        }
+    )
+    return await async_query(
+        auth,
+        url=url,
+        reqtype="get",
+        data=data,
+        headers=headers
+    )
+
 def request_login(
     auth,
     url,
@@ -62,7 +167,7 @@ def request_login(
     :login_data: Dictionary containing ryobi login data.
     """
     headers = {
-        "Host": RYOBI_URL,
+        "Host": auth.host,
         "Content-Type": "application/json",
     }
     data = dumps(
@@ -81,8 +186,39 @@ def request_login(
         reqtype="post",
     )
 
+async def async_request_login(
+    auth,
+    url,
+    login_data,
+):
+    """
+    Login request on the event loop.
+    :param auth: AsyncAuth instance.
+    :param url: Login url.
+    :login_data: Dictionary containing ryobi login data.
+    """
+    headers = {
+        "Host": auth.host,
+        "Content-Type": "application/json",
+    }
+    data = dumps(
+        {
+            "username": login_data["username"],
+            "password": login_data["password"],
+        }
+    )
+
+    return await async_query(
+        auth,
+        url=url,
+        headers=headers,
+        data=data,
+        reqtype="post",
+    )
+
 def prepare_request(url, headers, data, reqtype):
         """Prepare a request."""
+        from requests import Request
         r = Request(reqtype.upper(), url, headers=headers, data=data)
         return r.prepare()
 
@@ -97,38 +233,101 @@ def query(
         timeout=HTTP_TIMEOUT,
     ):
         """
-        Perform server requests.
+        Perform server requests over the session's pooled connections.
         :param url: URL to perform request
         :param data: Data to send
         :param headers: Headers to send
         :param reqtype: Can be 'get' or 'post' (default: 'get')
         :param stream: Stream response? True/FALSE
         :param json_resp: Return JSON response? TRUE/False
+        :raises RyobiConnectionError: Endpoint unreachable after retries.
         """
-        req = prepare_request(url, headers, data, reqtype)
+        from requests import exceptions
+        started = time.perf_counter()
         try:
-            response = auth.session.send(req, stream=stream, timeout=timeout)
-            return response
-        except (exceptions.ConnectionError, exceptions.Timeout):
+            with metrics.span("ryobigdo.http", method=reqtype.upper(), url=url):
+                response = auth.session.request(
+                    reqtype.upper(),
+                    url,
+                    headers=headers,
+                    data=data,
+                    stream=stream,
+                    timeout=timeout,
+                )
+        except (exceptions.ConnectionError, exceptions.Timeout) as error:
+            if metrics.ENABLED:
+                observe_request(auth, url, started, "error")
             _LOGGER.error(
                 "Connection error. Endpoint %s possibly down.",
                 url,
             )
-        except RyobiBadResponse:
-            code = None
-            reason = None
+            raise RyobiConnectionError(url) from error
+        if metrics.ENABLED:
+            observe_request(auth, url, started, response.status_code)
+        return response
+
+async def async_query(
+        auth,
+        url=None,
+        data=None,
+        headers=None,
+        reqtype="get",
+        timeout=HTTP_TIMEOUT,
+    ):
+        """
+        Perform server requests on the event loop.
+        The body is read before returning so await response.json() can be
+        used once the connection has been released back to the pool.
+        GETs are retried on connection errors and 429/5xx with jittered
+        exponential backoff, like the requests adapter, using the retries,
+        backoff_factor and pool_maxsize of auth.host_limits for the URL's
+        host. A Retry-After on 429/503 replaces the backoff.
+        :param url: URL to perform request
+        :param data: Data to send
+        :param headers: Headers to send
+        :param reqtype: Can be 'get' or 'post' (default: 'get')
+        :raises RyobiConnectionError: Endpoint unreachable after retries.
+        """
+        import asyncio #Only loaded by async callers, who already have it.
+        import aiohttp
+        session = await auth.get_session()
+        host = urlparse(url).netloc
+        limits = auth.host_limits.get(host, {})
+        retries = limits.get("retries", HTTP_RETRIES) if reqtype.lower() == "get" else 0
+        backoff_factor = limits.get("backoff_factor", HTTP_BACKOFF_FACTOR)
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            delay = None
             try:
-                code = response.status_code
-                reason = response.reason
-            except AttributeError:
-                pass
-            _LOGGER.error(
-                "Expected json response from %s, but received: %s: %s",
-                url,
-                code,
-                reason,
-            )
-        return None
+                with metrics.span("ryobigdo.http", method=reqtype.upper(), url=url):
+                    async with auth.host_slot(host):
+                        async with session.request(
+                            reqtype.upper(),
+                            url,
+                            headers=headers,
+                            data=data,
+                            timeout=aiohttp.ClientTimeout(total=timeout),
+                        ) as response:
+                            await response.read()
+                if metrics.ENABLED:
+                    observe_request(auth, url, started, response.status)
+                if response.status not in HTTP_RETRY_STATUSES or attempt == retries:
+                    return response
+                if response.status in (429, 503):
+                    delay = retry_after(response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                if metrics.ENABLED:
+                    observe_request(auth, url, started, "error")
+                if attempt == retries:
+                    _LOGGER.error(
+                        "Connection error. Endpoint %s possibly down.",
+                        url,
+                    )
+                    raise RyobiConnectionError(url) from error
+            await asyncio.sleep(backoff_time(attempt, backoff_factor) if delay is None else delay)
+
+class RyobiConnectionError(Exception):
+    """Class to throw when an endpoint can't be reached."""
 
 class RyobiBadResponse(Exception):
     """Class to throw bad json response exception."""
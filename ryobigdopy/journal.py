@@ -0,0 +1,145 @@
+"""Append-only journal of device payloads, notifications and commands."""
+
+import logging
+import mmap
+import os
+import threading
+import time
+from collections import namedtuple
+from .helpers import json_backend
+from .helpers.constants import JOURNAL_SEGMENT_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+ENTRY = "e" #Device payload from get_device/get_devices
+NOTIFICATION = "n" #wskAttributeUpdateNtfy params
+COMMAND = "c" #{"target": "garageDoor_7.doorCommand", "value": "1"}
+
+JournalRecord = namedtuple("JournalRecord", "timestamp device_id kind data")
+
+SEGMENT_SUFFIX = ".jsonl"
+
+class Journal:
+    """
+    JSONL records in a directory of segments named after the millisecond
+    timestamp of their first record. A segment is closed once it reaches
+    segment_size and the oldest are deleted beyond max_segments.
+    Readers map segments into memory and only decode lines that
+    mention the requested device.
+    """
+
+    def __init__(self, path, segment_size=JOURNAL_SEGMENT_SIZE, max_segments=None):
+        """
+        :param path: Directory holding the segments, created if missing.
+        :param segment_size: Bytes per segment before rotating.
+        :param max_segments: Optional number of segments to keep.
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        os.makedirs(path, exist_ok=True)
+
+    def segments(self):
+        """Return the (start_ms, path) of every segment, oldest first."""
+        segments = []
+        for name in os.listdir(self.path):
+            stem, suffix = os.path.splitext(name)
+            if suffix == SEGMENT_SUFFIX and stem.isdigit():
+                segments.append((int(stem), os.path.join(self.path, name)))
+        segments.sort()
+        return segments
+
+    def append(self, device_id, kind, data, timestamp=None):
+        """Write one record. timestamp defaults to now, in seconds."""
+        if timestamp is None:
+            timestamp = time.time()
+        line = (json_backend.dumps({"t": timestamp, "d": device_id, "k": kind, "p": data}) + "\n").encode()
+        with self._lock:
+            if self._file is None or self._size + len(line) > self.segment_size:
+                self._rotate(timestamp)
+            self._file.write(line)
+            self._file.flush() #Visible to readers mapping the segment.
+            self._size += len(line)
+
+    def _rotate(self, timestamp):
+        segments = self.segments()
+        if self._file is None and segments: #Resume the last segment.
+            path = segments[-1][1]
+            self._file = open(path, "ab")
+            self._size = self._file.tell()
+            if self._size < self.segment_size:
+                return
+        if self._file is not None:
+            self._file.close()
+        start = int(timestamp * 1000)
+        if segments:
+            start = max(start, segments[-1][0] + 1)
+        path = os.path.join(self.path, f"{start:013d}{SEGMENT_SUFFIX}")
+        _LOGGER.debug("Starting journal segment %s", path)
+        self._file = open(path, "ab")
+        self._size = 0
+        segments.append((start, path))
+        if self.max_segments is not None:
+            for _, old_path in segments[:-self.max_segments]:
+                os.remove(old_path)
+
+    def read(self, start=None, end=None, device_id=None):
+        """
+        Yield JournalRecords in write order.
+        :param start: Optional earliest timestamp, in seconds.
+        :param end: Optional latest timestamp, in seconds.
+        :param device_id: Optional device to filter on.
+        """
+        needle = None if device_id is None else json_backend.dumps(device_id).encode()
+        segments = self.segments()
+        for index, (segment_start, path) in enumerate(segments):
+            if end is not None and segment_start > end * 1000:
+                break
+            if start is not None and index + 1 < len(segments) and segments[index + 1][0] <= start * 1000:
+                continue #Every record is older than start.
+            for record in self._read_segment(path, needle):
+                if device_id is not None and record.device_id != device_id:
+                    continue
+                if start is not None and record.timestamp < start:
+                    continue
+                if end is not None and record.timestamp > end:
+                    continue
+                yield record
+
+    def _read_segment(self, path, needle):
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for line in iter(view.readline, b""):
+                    if needle is not None and needle not in line:
+                        continue
+                    if not line.endswith(b"\n"): #Partly written record.
+                        break
+                    data = json_backend.loads(line)
+                    yield JournalRecord(data["t"], data["d"], data["k"], data["p"])
+
+    def history(self, device_id, attribute, start=None, end=None):
+        """
+        Yield (timestamp, value) for each reported value of an attribute,
+        e.g. history(device_id, "doorState") for door open/close audits.
+        """
+        for record in self.read(start, end, device_id):
+            if record.kind == NOTIFICATION:
+                for key, update in record.data.items():
+                    if key.partition(".")[2] == attribute and isinstance(update, dict) and "value" in update:
+                        yield record.timestamp, update["value"]
+            elif record.kind == ENTRY:
+                for module in record.data.get("deviceTypeMap", {}).values():
+                    update = module.get("at", {}).get(attribute)
+                    if update is not None and "value" in update:
+                        yield record.timestamp, update["value"]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
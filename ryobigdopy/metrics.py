@@ -0,0 +1,129 @@
+"""
+Optional metrics and tracing hooks.
+
+Nothing is recorded until enable() is called. Call sites check ENABLED
+before timing anything, so disabled metrics cost one attribute lookup.
+
+    metrics.enable(tracer=opentelemetry.trace.get_tracer("ryobigdopy"))
+    print(metrics.REGISTRY.export())
+"""
+
+import threading
+from contextlib import contextmanager
+
+ENABLED = False
+_TRACER = None
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=None):
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+class Counter:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def export(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.values = {} #labels: [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def export(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts in self.values.items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', bound))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {counts[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {counts[-1]}")
+        return lines
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help_text):
+        return self.metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def export(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.export())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+LOGIN_SECONDS = REGISTRY.histogram("ryobigdo_login_seconds", "Login latency.")
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("ryobigdo_http_request_seconds", "HTTP API latency by endpoint and status.")
+WS_CONNECT_SECONDS = REGISTRY.histogram("ryobigdo_ws_connect_seconds", "Websocket connect, auth and subscribe time.")
+WS_FRAMES = REGISTRY.counter("ryobigdo_ws_frames_total", "Websocket frames by direction.")
+WS_DECODE_SECONDS = REGISTRY.histogram("ryobigdo_ws_decode_seconds", "Websocket frame decode time.")
+WS_CALLBACK_SECONDS = REGISTRY.histogram("ryobigdo_ws_callback_seconds", "Notification callback time.")
+WS_RECONNECTS = REGISTRY.counter("ryobigdo_ws_reconnects_total", "Websocket reconnects by reason.")
+
+def enable(tracer=None):
+    """
+    Start recording metrics.
+    :param tracer: Optional OpenTelemetry compatible tracer
+                   (anything with start_as_current_span(name, attributes=...)).
+    """
+    global ENABLED, _TRACER
+    ENABLED = True
+    _TRACER = tracer
+
+def disable():
+    global ENABLED, _TRACER
+    ENABLED = False
+    _TRACER = None
+
+@contextmanager
+def _no_span():
+    yield None
+
+def span(name, **attributes):
+    """Return a span context manager from the tracer, or a no-op one."""
+    if _TRACER is None:
+        return _no_span()
+    return _TRACER.start_as_current_span(name, attributes=attributes)
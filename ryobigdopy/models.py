@@ -0,0 +1,206 @@
+"""Compact state records for the modules of a Ryobi garage door opener."""
+
+DOOR_STATES = ("Closed", "Open", "Closing", "Opening", "Fault")
+
+_ENUMS = {DOOR_STATES: DOOR_STATES}
+
+def intern_enum(values):
+    """Return the shared tuple for an enum list so devices don't each keep a copy."""
+    key = tuple(values)
+    return _ENUMS.setdefault(key, key)
+
+class Attribute:
+    """A module attribute as reported by the API."""
+
+    __slots__ = ("value", "lastSet", "lastValue")
+
+    def __init__(self, value=None, lastSet=None, lastValue=None):
+        self.value = value
+        self.lastSet = lastSet
+        self.lastValue = lastValue
+
+    def update(self, data):
+        """Update in place from an API attribute dict (value/lastSet/lastValue)."""
+        if "value" in data:
+            self.value = data["value"]
+        if "lastSet" in data:
+            self.lastSet = data["lastSet"]
+        if "lastValue" in data:
+            self.lastValue = data["lastValue"]
+
+    def as_dict(self):
+        return {
+            "lastSet": self.lastSet,
+            "lastValue": self.lastValue,
+            "value": self.value,
+        }
+
+class EnumAttribute(Attribute):
+    """An attribute whose value indexes a shared enum tuple."""
+
+    __slots__ = ("enum",)
+
+    def __init__(self, enum, value=None, lastSet=None, lastValue=None):
+        super().__init__(value, lastSet, lastValue)
+        self.enum = intern_enum(enum)
+
+    def update(self, data):
+        super().update(data)
+        if "enum" in data:
+            self.enum = intern_enum(data["enum"])
+
+    @property
+    def state(self):
+        """Return the enum name of the current value, if known."""
+        if isinstance(self.value, int) and 0 <= self.value < len(self.enum):
+            return self.enum[self.value]
+        return None
+
+    def as_dict(self):
+        view = super().as_dict()
+        view["enum"] = list(self.enum)
+        view["state"] = self.state
+        return view
+
+MODULES = {} #deviceTypeMap module name: record class
+
+BINDING = ("moduleId", "portId") #Attributes taken into moduleType/port by bind(), not kept as attributes.
+
+def register_module(name):
+    """Class decorator registering the record class for a module name, e.g. "garageDoor"."""
+    def decorator(cls):
+        MODULES[name] = cls
+        return cls
+    return decorator
+
+def split_key(key):
+    """Split a deviceTypeMap key like "garageDoor_7" into ("garageDoor", 7)."""
+    name, _, port = key.rpartition("_")
+    if name and port.isdigit():
+        return name, int(port)
+    return key, None
+
+def module_class(key):
+    """Return the record class for a deviceTypeMap key, GenericModule if unregistered."""
+    return MODULES.get(split_key(key)[0], GenericModule)
+
+class Module:
+    """
+    Base for module records. Subclasses list their attributes in __slots__,
+    any other attribute the API sends is kept in the attributes dict.
+    key, port and moduleType locate the module for gdoModuleCommand.
+    """
+
+    __slots__ = ("key", "port", "moduleType", "attributes")
+    MODULE_TYPE = None #moduleType used when the payload has no moduleId.
+    COMMANDS = () #moduleMsg keys the module accepts.
+
+    def __init__(self):
+        self.key = None
+        self.port = None
+        self.moduleType = self.MODULE_TYPE
+        self.attributes = None #Created with the first attribute not in __slots__.
+
+    @classmethod
+    def accepts(cls, name):
+        """Return True if the record keeps attribute name, which is any but BINDING."""
+        return name not in BINDING
+
+    def bind(self, key, attributes=None):
+        """Set the deviceTypeMap key, and moduleType/portId from its "at" dict if given."""
+        self.key = key
+        self.port = split_key(key)[1]
+        if attributes:
+            self.moduleType = attributes.get("moduleId", {}).get("value", self.moduleType)
+            self.port = attributes.get("portId", {}).get("value", self.port)
+
+    def attribute(self, name, data=None):
+        """Return the Attribute for name, creating it if it isn't one of __slots__. None for BINDING."""
+        if name in self.__slots__:
+            return getattr(self, name)
+        if name in BINDING:
+            return None
+        if self.attributes is None:
+            self.attributes = {}
+        attribute = self.attributes.get(name)
+        if attribute is None:
+            attribute = EnumAttribute(data["enum"]) if data and "enum" in data else Attribute()
+            self.attributes[name] = attribute
+        return attribute
+
+    def load(self, attributes):
+        """Update in place from a deviceTypeMap module's "at" dict."""
+        for name, data in attributes.items():
+            attribute = self.attribute(name, data)
+            if attribute is not None:
+                attribute.update(data)
+
+    def apply(self, name, update):
+        """Apply a websocket update to one attribute. Returns False if unknown."""
+        attribute = self.attribute(name, update)
+        if attribute is None:
+            return False
+        attribute.update(update)
+        return True
+
+    def as_dict(self):
+        view = {name: getattr(self, name).as_dict() for name in self.__slots__}
+        if self.attributes:
+            view.update((name, attribute.as_dict()) for name, attribute in self.attributes.items())
+        return view
+
+class GenericModule(Module):
+    """
+    Record for modules without a registered class (fan, inflator, speaker,
+    bluetooth, park assist, ...). Keeps every attribute it is sent.
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__()
+        self.attributes = {}
+
+@register_module("garageDoor")
+class GarageDoor(Module):
+
+    __slots__ = ("vacationMode", "sensorFlag", "doorState", "doorPercentOpen", "doorPosition")
+    MODULE_TYPE = 5
+    COMMANDS = ("doorCommand",)
+
+    def __init__(self):
+        super().__init__()
+        self.vacationMode = Attribute()
+        self.sensorFlag = Attribute() #Safety sensor
+        self.doorState = EnumAttribute(DOOR_STATES)
+        self.doorPercentOpen = Attribute()
+        self.doorPosition = Attribute()
+
+    def as_dict(self):
+        view = super().as_dict()
+        view["vacationMode"] = self.vacationMode.value
+        view["doorPercentOpen"] = self.doorPercentOpen.value
+        return view
+
+@register_module("garageLight")
+class GarageLight(Module):
+
+    __slots__ = ("lightState", "lightTimer")
+    MODULE_TYPE = 5
+    COMMANDS = ("lightState",)
+
+    def __init__(self):
+        super().__init__()
+        self.lightState = Attribute()
+        self.lightTimer = Attribute()
+
+@register_module("masterUnit")
+class MasterUnit(Module):
+
+    __slots__ = ("serialNumber", "macAddress", "appVersion")
+
+    def __init__(self):
+        super().__init__()
+        self.serialNumber = Attribute()
+        self.macAddress = Attribute()
+        self.appVersion = Attribute()
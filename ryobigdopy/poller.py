@@ -0,0 +1,124 @@
+"""HTTP polling fallback for devices whose websocket is down."""
+
+import asyncio
+import logging
+import random
+import time
+from functools import partial
+from .auth import AsyncAuth
+from .fleet import apply_many, async_refresh_many, fetch_many
+from .ws_api import STATE_CONNECTED, STATE_STOPPED
+from .helpers.constants import (
+    POLL_GRACE,
+    POLL_FAST_INTERVAL,
+    POLL_SLOW_INTERVAL,
+    POLL_JITTER,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+MOVING_STATES = ("Opening", "Closing")
+
+def jittered(interval, jitter=POLL_JITTER):
+    """Return interval spread uniformly by +-jitter so pollers don't line up."""
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+class PollFallback:
+    """
+    Polls devices over HTTP while their websocket is not connected.
+    Idle devices are fetched together with one get_devices call every
+    slow_interval. Moving doors and devices with pending commands are
+    fetched on their own every fast_interval. Polling stops as soon as
+    the websocket is connected again.
+    """
+
+    def __init__(
+        self,
+        devices,
+        ws,
+        grace=POLL_GRACE,
+        fast_interval=POLL_FAST_INTERVAL,
+        slow_interval=POLL_SLOW_INTERVAL,
+        jitter=POLL_JITTER,
+    ):
+        """
+        :param devices: RyobiGDO objects of one account.
+        :param ws: RyobiWebsocket or RyobiWebsocketHub whose state is watched.
+        :param grace: Seconds the socket may be down before polling starts.
+        """
+        self.devices = list(devices)
+        self.ws = ws
+        self.grace = grace
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.jitter = jitter
+        self.active = False
+        self.last_poll = None
+        self._stopped = False
+
+    def is_moving(self, device):
+        return device.door.doorState.state in MOVING_STATES or bool(device.pending)
+
+    async def run(self):
+        """Watch the websocket and poll while it is down, until stop()."""
+        self._stopped = False
+        down_since = None
+        next_slow = next_fast = 0
+        while not self._stopped:
+            now = time.monotonic()
+            if self.ws.state is STATE_STOPPED: #Closed on purpose, nothing to fall back for.
+                _LOGGER.debug("Websocket stopped, poller exiting.")
+                break
+            if self.ws.state is STATE_CONNECTED:
+                if self.active:
+                    _LOGGER.info("Websocket recovered, stopped polling %s devices.", len(self.devices))
+                    self.active = False
+                down_since = None
+                await asyncio.sleep(self.fast_interval)
+                continue
+
+            if down_since is None:
+                down_since = now
+            if not self.active:
+                if now - down_since < self.grace:
+                    await asyncio.sleep(min(self.fast_interval, self.grace))
+                    continue
+                _LOGGER.warning("Websocket %s, polling %s devices over HTTP.", self.ws.state, len(self.devices))
+                self.active = True
+                next_slow = next_fast = now
+
+            if now >= next_slow:
+                await self.poll(self.devices, per_device=False)
+                next_slow = time.monotonic() + jittered(self.slow_interval, self.jitter)
+                next_fast = time.monotonic() + jittered(self.fast_interval, self.jitter)
+            elif now >= next_fast:
+                moving = [device for device in self.devices if self.is_moving(device)]
+                if moving:
+                    await self.poll(moving, per_device=True)
+                next_fast = time.monotonic() + jittered(self.fast_interval, self.jitter)
+            await asyncio.sleep(max(0, min(next_slow, next_fast) - time.monotonic()))
+
+    async def poll(self, devices, per_device):
+        """Refresh devices, with one get_device each or one get_devices for all."""
+        if not devices:
+            return
+        self.last_poll = time.time()
+        if isinstance(devices[0].auth, AsyncAuth):
+            if per_device:
+                results = await asyncio.gather(
+                    *(device.async_update_device() for device in devices), return_exceptions=True
+                )
+                failed = [error for error in results if isinstance(error, Exception)]
+            else:
+                results = await async_refresh_many(devices)
+                failed = [result.error for result in results.values() if not result.ok]
+        else: #Fetched on a thread, applied here on the loop that owns the devices.
+            loop = asyncio.get_event_loop()
+            fetched = await loop.run_in_executor(None, partial(fetch_many, devices, per_device=per_device))
+            results = apply_many(devices, fetched)
+            failed = [result.error for result in results.values() if not result.ok]
+        if failed:
+            _LOGGER.warning("Polling failed for %s of %s devices: %r", len(failed), len(devices), failed[0])
+
+    def stop(self):
+        self._stopped = True
@@ -5,72 +5,228 @@ Implements a Ryobi Garage Door Opener from their API
 import asyncio
 import json
 import logging
-from helpers.constants import HTTP_ENDPOINT
-import http_api
-import ws_api
+import sys
+import time
+from . import http_api
+from . import journal as journal_api
+from . import ws_api
+from .auth import AsyncAuth
+from .device_view import DeviceView, projection
+from .helpers import json_backend
+from .poller import PollFallback
+from .models import GarageDoor, GarageLight, MasterUnit, module_class, split_key
+from .scheduler import CommandScheduler, CommandError, CommandTimeoutError, PendingCommand, account_bucket
+from .state import StateStore
+from .helpers.constants import COMMAND_CONFIRM_TIMEOUT
 
 _LOGGER = logging.getLogger(__name__)
 
+_DISPATCH = {"topic": None, "varName": None} #Notification key: setter(gdo, update), None to skip.
+_PRIMARY = {GarageDoor: "door", GarageLight: "light", MasterUnit: "master"} #Record class: attribute its first module fills.
+
+def compile_key(key):
+    """Return a setter(gdo, update) for a module_N.attribute notification key."""
+    moduleKey, _, moduleState = key.partition(".")
+    if moduleState and module_class(moduleKey).accepts(moduleState):
+        label = split_key(moduleKey)[0]
+        return lambda gdo, update: gdo.store.apply(gdo.device_id, label, gdo.module(moduleKey), moduleState, update)
+    _LOGGER.warning("Did not recognize notification key: %s", key)
+    return None
+
 class RyobiGDO:
-    def __init__(self, auth, id=None):
+    def __init__(self, auth, id=None, directory=None, store=None, journal=None, fetch=True, fields=None):
+        """
+        :param auth: Auth or AsyncAuth instance. None for offline use, e.g. replay().
+        :param id: Device id. Its state is loaded on creation with Auth.
+        :param fetch: False to skip that load, when state comes from e.g. a snapshot.
+        :param directory: Optional DeviceDirectory to seed state from
+                          and to store fetched payloads in.
+        :param store: Optional StateStore shared with other devices.
+                      Subscribe to it for change events.
+        :param journal: Optional journal.Journal recording payloads,
+                        notifications and commands of this device.
+        :param fields: Optional projection, e.g. ("doorState",), limiting which
+                       attributes HTTP payloads load. See device_view.Projection.
+        """
         _LOGGER.debug("Creating RyobiGDO object.")
         self.auth = auth
         self.device_id = id
+        self.directory = directory
+        self.journal = journal
+        self.fields = projection(fields)
         self.ws = None
+        self.hub = None
+        self.poller = None
         self.wsState = None
+        self._scheduler = None #Created by the first command, most devices never get one.
 
         self.name = None
         self.description = None
         self.version = None
         self.lastSeen = None
         self.lastUpdate = None
-        self.serial = None
-        self.mac = None
-        self.wifiVersion = None
-        self.garageDoor = {
-            "vacationMode": None,
-            "sensorFlag": {
-                "lastSet": None,
-                "lastValue": None,
-                "value": None,
-            },
-            "doorState": {
-                "lastSet": None,
-                "lastValue": None,
-                "value": None,
-                "enum": ["Closed", "Open", "Closing", "Opening", "Fault"],
-            },
-            "doorPosition": {
-                "lastSet": None,
-                "lastValue": None,
-                "value": None,
-            }
-        }
-        self.garageLight = {
-            "lightState": {
-                "lastSet": None,
-                "lastValue": None,
-                "value": None,
-            },
-            "lightTimer": {
-                "lastSet": None,
-                "lastValue": None,
-                "value": None,
-            },
-        }
+        self.store = StateStore() if store is None else store
+        self.door = GarageDoor()
+        self.light = GarageLight()
+        self.master = MasterUnit()
+        self.modules = {} #deviceTypeMap key: module record
+        self.pending = {} #Notification key: PendingCommand awaiting confirmation
 
         self.device_response = None
         
-        if self.auth is not None and self.device_id is not None:
+        if self.directory is not None and self.device_id is not None:
+            entry = self.directory.get(self.device_id)
+            if entry is not None and "deviceTypeMap" in entry:
+                self.load_entry(entry, fetched=False)
+                return
+
+        if fetch and self.auth is not None and self.device_id is not None:
+            if isinstance(self.auth, AsyncAuth): #Caller awaits async_update_device().
+                return
             self.update_device()
 
-    def connect_ws(self):
+    @property
+    def scheduler(self):
+        """CommandScheduler of the device, created on first use."""
+        if self._scheduler is None:
+            self._scheduler = CommandScheduler(
+                self._send_command,
+                bucket=None if self.auth is None else account_bucket(self.auth),
+            )
+        return self._scheduler
+
+    def cancel_commands(self):
+        """Drop every queued command, without creating a scheduler."""
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+
+    @property
+    def garageDoor(self):
+        """Read-only dict view of the garage door state."""
+        return self.door.as_dict()
+
+    @property
+    def garageLight(self):
+        """Read-only dict view of the garage light state."""
+        return self.light.as_dict()
+
+    @property
+    def serial(self):
+        return self.master.serialNumber.value
+
+    @property
+    def mac(self):
+        return self.master.macAddress.value
+
+    @property
+    def wifiVersion(self):
+        return self.master.appVersion.value
+
+    def module(self, key, attributes=None):
+        """
+        Return the record for a deviceTypeMap key (e.g. garageDoor_7),
+        creating it on first sight. The first door, light and master unit
+        fill self.door, self.light and self.master.
+        :param attributes: Optional "at" dict to take moduleId/portId from.
+        """
+        record = self.modules.get(key)
+        if record is None:
+            key = sys.intern(key) #One copy of e.g. "garageDoor_4" for the whole fleet.
+            cls = module_class(key)
+            primary = _PRIMARY.get(cls)
+            record = None if primary is None else getattr(self, primary)
+            if record is None or record.key is not None: #Already bound to another module.
+                record = cls()
+            self.modules[key] = record
+            record.bind(key, attributes)
+        elif attributes:
+            record.bind(key, attributes)
+        return record
+
+    @classmethod
+    def from_journal(cls, journal, device_id, end=None, store=None):
+        """Rebuild a device as it was at time end (default: now) from a Journal, offline."""
+        gdo = cls(None, device_id, store=store)
+        gdo.replay(journal, end=end)
+        return gdo
+
+    def replay(self, journal, start=None, end=None):
+        """
+        Apply journaled payloads and notifications of this device, without
+        network calls. Commands are skipped, they only change state through
+        the notifications that followed them.
+        """
+        own_journal, self.journal = self.journal, None #Don't journal the replay.
+        try:
+            for record in journal.read(start, end, self.device_id):
+                if record.kind == journal_api.ENTRY:
+                    self.device_response = {"result": [record.data]}
+                    self.extract_device_info()
+                elif record.kind == journal_api.NOTIFICATION:
+                    self.ws_entity_update({"method": "wskAttributeUpdateNtfy", "params": record.data})
+                else:
+                    continue
+                self.lastUpdate = record.timestamp
+        finally:
+            self.journal = own_journal
+
+    @classmethod
+    def from_directory(cls, auth, directory):
+        """Create a RyobiGDO for every device in a filled DeviceDirectory."""
+        return [cls(auth, device_id, directory) for device_id in directory.device_ids()]
+
+    def connect_ws(self, hub=None, poll=True):
+        """
+        Connect to the websocket.
+        :param hub: Optional RyobiWebsocketHub to share with other devices.
+                    The device is registered and the caller runs hub.listen(),
+                    and a PollFallback over the hub's devices if wanted.
+        :param poll: Poll over HTTP while the websocket is down.
+        """
+        if hub is not None:
+            self.hub = hub
+            self.ws = hub.ws
+            hub.register(self.device_id, self.process_ws_msg)
+            return
+
+        self.ws = ws_api.RyobiWebsocket(self.process_ws_msg, self.auth, self.device_id)
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError: #No loop set for this thread, e.g. after asyncio.run().
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+        loop.run_until_complete(self._listen(poll))
+
+    async def async_connect_ws(self, hub=None, poll=True):
+        """
+        Connect to the websocket on the running event loop.
+        Returns once the socket stops, or right away when sharing a hub.
+        :param poll: Poll over HTTP while the websocket is down.
+        """
+        if hub is not None:
+            self.connect_ws(hub)
+            return
+
         self.ws = ws_api.RyobiWebsocket(self.process_ws_msg, self.auth, self.device_id)
-        loop = asyncio.get_event_loop()
-        # loop.create_task(do_other())
-        loop.run_until_complete(self.ws.listen())
+        await self._listen(poll)
+
+    async def _listen(self, poll):
+        if not poll:
+            return await self.ws.listen()
+        self.poller = PollFallback([self], self.ws)
+        polling = asyncio.ensure_future(self.poller.run())
+        try:
+            await self.ws.listen()
+        finally:
+            self.poller.stop()
+            polling.cancel()
 
     def close_ws(self):
+        if self.hub is not None: #Shared socket stays up for other devices.
+            self.hub.unregister(self.device_id)
+            self.hub = None
+            self.ws = None
+            return
         self.ws.close()
         
     def process_ws_msg(self, topic, data, error=None): 
@@ -86,37 +242,24 @@ class RyobiGDO:
         return False
 
     def ws_entity_update(self, data):
-        msgType = data["method"]
-        msgDeviceId = data["params"]["varName"]
+        msgType = data.get("method")
 
         if msgType == "wskAttributeUpdateNtfy":
-            msgKeys = list(data["params"].keys())
-            for key in msgKeys:
-                if key == "topic" or key == "varName":
+            self.lastUpdate = time.time()
+            if self.journal is not None:
+                self.journal.append(self.device_id, journal_api.NOTIFICATION, data["params"], self.lastUpdate)
+            for key, moduleUpdate in data["params"].items():
+                try:
+                    setter = _DISPATCH[key]
+                except KeyError:
+                    setter = _DISPATCH[key] = compile_key(key)
+                if setter is None:
                     continue
 
-                if "." not in key:
-                    break
-
-                keySplit = key.partition(".")
-                moduleName = keySplit[0]
-                moduleState = keySplit[2]
-                moduleUpdate = data["params"][f"{key}"]
-
-                _LOGGER.info("Processing notification update for %s: %s", key, moduleUpdate)
-
-                if "garageDoor_" in moduleName:
-                    for item in moduleUpdate:
-                        self.garageDoor[moduleState][item] = moduleUpdate[item]
-                        #TODO self.garageDoor["state"] = self.garageDoor["doorState"]["enum"][self.garageDoor["doorState"]["value"]]
-                    continue
-                elif "garageLight_" in moduleName:
-                    for item in moduleUpdate:
-                        self.garageLight[moduleState][item] = moduleUpdate[item]
-                    continue
-                else:
-                    _LOGGER.warn("Did not recognize last module name: %s", moduleName)
-                    break
+                _LOGGER.debug("Processing notification update for %s: %s", key, moduleUpdate)
+                setter(self, moduleUpdate)
+                if self.pending:
+                    self.confirm(key, moduleUpdate)
             return True
 
         _LOGGER.error("Could not process RyobiWebsocket message. Unrecognized type/module: %s. Data: %s", msgType, data)
@@ -127,7 +270,7 @@ class RyobiGDO:
         if error is not None: #is state error update
             _LOGGER.error("Relaying RyobiWebsocket %s: %s", data, error)
             return True
-        _LOGGER.info("Relaying RyobiWebsocket State: %s", data)
+        _LOGGER.debug("Relaying RyobiWebsocket State: %s", data)
         return True
 
     def update_device(self):
@@ -135,109 +278,210 @@ class RyobiGDO:
             _LOGGER.error("No device_id exists or was given to update")
             return False
 
-        _LOGGER.info("Updating device info...")
+        _LOGGER.debug("Updating device info...")
 
         response = http_api.get_device(self.auth, self.device_id)
         try:
             if response.status_code == 200:
-                self.device_response = response.json()
+                device_response = json_backend.loads(response.content) #Decoded once, also returned.
+                self.device_response = device_response
+                if self.directory is not None:
+                    self.directory.put(self.device_id, device_response["result"][0])
+                self.extract_device_info()
+                return device_response
+            raise DeviceResponseError
+        except AttributeError as error:
+            raise DeviceResponseError from error
+
+    async def async_update_device(self):
+        if self.device_id is None:
+            _LOGGER.error("No device_id exists or was given to update")
+            return False
+
+        _LOGGER.debug("Updating device info...")
+
+        response = await http_api.async_get_device(self.auth, self.device_id)
+        try:
+            if response.status == 200:
+                device_response = await response.json(content_type=None, loads=json_backend.loads)
+                self.device_response = device_response
+                if self.directory is not None:
+                    self.directory.put(self.device_id, device_response["result"][0])
                 self.extract_device_info()
-                return response.json()
+                return device_response
             raise DeviceResponseError
         except AttributeError as error:
             raise DeviceResponseError from error
 
+    def load_entry(self, entry, fetched=True):
+        """
+        Update state from one entry of a get_devices/get_device result list.
+        :param fetched: False when the entry came from the directory, so its
+                        fetched_at (and TTL) is left alone.
+        """
+        if fetched and self.directory is not None:
+            self.directory.put(self.device_id, entry)
+        self.device_response = {"result": [entry]}
+        return self.extract_device_info()
+
     def extract_device_info(self):
         if self.device_response is None:
             _LOGGER.error("Variable device_response is empty. Cannot extract info.")
             raise AttributeError("No response info available to extract!")
 
-        first_result = self.device_response["result"][0]
-        garageDoor = first_result["deviceTypeMap"]["garageDoor_4"]["at"]
-        garageLight = first_result["deviceTypeMap"]["garageLight_4"]["at"]
-
-        self.name = first_result["metaData"]["name"]
-        self.description = first_result["metaData"]["description"]
-        self.version = first_result["metaData"]["version"]
-        self.lastSeen = first_result["metaData"]["sys"]["lastSeen"]
-        self.serial = first_result["deviceTypeMap"]["masterUnit"]["at"]["serialNumber"]["value"]
-        self.mac = first_result["deviceTypeMap"]["masterUnit"]["at"]["macAddress"]["value"]
-        self.wifiVersion = first_result["deviceTypeMap"]["masterUnit"]["at"]["appVersion"]["value"]
-        self.garageDoor = {
-            "vacationMode": garageDoor["vacationMode"]["value"],
-            "sensorFlag": {
-                "lastSet": garageDoor["sensorFlag"]["lastSet"],
-                "lastValue": garageDoor["sensorFlag"]["lastValue"],
-                "value": garageDoor["sensorFlag"]["value"],
-            },
-            "doorState": {
-                "lastSet": garageDoor["doorState"]["lastSet"],
-                "lastValue": garageDoor["doorState"]["lastValue"],
-                "value": garageDoor["doorState"]["value"],
-                "enum": garageDoor["doorState"]["enum"],
-                "state": garageDoor["doorState"]["enum"][garageDoor["doorState"]["value"]]
-            },
-            "doorPercentOpen": garageDoor["doorPercentOpen"]["value"],
-            "doorPosition": {
-                "lastSet": garageDoor["doorPosition"]["lastSet"],
-                "lastValue": garageDoor["doorPosition"]["lastValue"],
-                "value": garageDoor["doorPosition"]["value"],
-            }
-        }
-        self.garageLight= {
-            "lightState": {
-                "lastSet": garageLight["lightState"]["lastSet"],
-                "lastValue": garageLight["lightState"]["lastValue"],
-                "value": garageLight["lightState"]["value"],
-            },
-            "lightTimer": {
-                "lastSet": garageLight["lightTimer"]["lastSet"],
-                "lastValue": garageLight["lightTimer"]["lastValue"],
-                "value": garageLight["lightTimer"]["value"],
-            },
-        }
+        view = DeviceView.from_response(self.device_response, self.fields)
+        if not view.has_modules:
+            raise KeyError("deviceTypeMap")
+        self.lastUpdate = time.time()
+        if self.journal is not None:
+            self.journal.append(self.device_id, journal_api.ENTRY, view.entry, self.lastUpdate)
+
+        self.name = view.name
+        self.description = view.description
+        self.version = view.version
+        self.lastSeen = view.lastSeen
+        for key, attributes in view.modules():
+            self.store.load(self.device_id, split_key(key)[0], self.module(key, attributes), attributes)
+            if self.pending: #Fetched state, e.g. from polling, confirms commands like a notification.
+                for name, data in attributes.items():
+                    if f"{key}.{name}" in self.pending:
+                        self.confirm(f"{key}.{name}", data)
         self.device_response = None
-        _LOGGER.info("Device information updated!")
+        _LOGGER.debug("Device information updated!")
         return True
 
+    def command_target(self, command, module=None):
+        """
+        Return the "module_key.command" target of a command.
+        :param module: deviceTypeMap key, by default the module accepting command.
+        """
+        if module is None:
+            module = next((key for key, record in self.modules.items() if command in record.COMMANDS), None)
+        if module not in self.modules:
+            raise UnknownModuleError(f"No module of {self.device_id} for {command} ({module}).")
+        return f"{module}.{command}"
+
+    async def send_command(self, command, value, module=None):
+        """
+        Queue a command. Redundant queued commands are merged into the last one.
+        :param module: deviceTypeMap key (e.g. fan_2), found from the command by default.
+        """
+        return await self.scheduler.submit(self.command_target(command, module), value)
+
+    async def _send_command(self, target, value):
+        key, _, command = target.partition(".")
+        record = self.modules[key]
+        if self.journal is not None:
+            self.journal.append(self.device_id, journal_api.COMMAND, {"target": target, "value": value})
+        return await self.ws.send_command(
+            command, value, self.device_id, module_type=record.moduleType, port_id=record.port
+        )
+
+    def expect(self, command, value, attribute, expected, optimistic, force=False, timeout=COMMAND_CONFIRM_TIMEOUT):
+        """
+        Send a command and track it until attribute reports one of the
+        expected values. The attribute shows optimistic right away and is
+        rolled back if the send fails or nothing confirms it within timeout.
+        A call expecting the same as a pending one gets the pending handle.
+        :return: PendingCommand to await for the confirmed value.
+        """
+        target = self.command_target(command)
+        module_key = target.partition(".")[0]
+        key = f"{module_key}.{attribute}"
+        record = self.modules[module_key]
+        previous = record.attribute(attribute).value
+
+        existing = self.pending.pop(key, None)
+        if existing is not None:
+            if existing.expected == expected and not force:
+                self.pending[key] = existing
+                return existing
+            previous = existing.previous
+            existing.fail(CommandError(f"{key} superseded by a new command."))
+
+        handle = self.pending[key] = PendingCommand(key, expected, previous)
+        handle.optimistic = optimistic
+        handle.command = target
+        self.store.apply(self.device_id, split_key(module_key)[0], record, attribute, {"value": optimistic})
+        handle.timer = asyncio.get_running_loop().call_later(
+            timeout, self.rollback, handle, CommandTimeoutError(f"{key} not confirmed after {timeout}s.")
+        )
+        asyncio.ensure_future(self._send_expected(handle, command, value, module_key))
+        return handle
+
+    async def _send_expected(self, handle, command, value, module):
+        try:
+            if await self.send_command(command, value, module) is False:
+                raise CommandError(f"Could not send {command}, websocket is not connected.")
+        except Exception as error:
+            self.rollback(handle, error)
+
+    def confirm(self, key, update):
+        """Resolve the pending command of key if update carries an expected value."""
+        handle = self.pending.get(key)
+        if handle is not None and update.get("value") in handle.expected:
+            del self.pending[key]
+            handle.resolve(update["value"])
+
+    def rollback(self, handle, error):
+        """
+        Restore the value from before handle, unless a notification replaced
+        it since. A command still queued by the scheduler is not sent.
+        """
+        if self.pending.get(handle.target) is not handle:
+            return
+        del self.pending[handle.target]
+        if handle.command is not None and self._scheduler is not None:
+            self._scheduler.discard(handle.command)
+        module_key, _, attribute = handle.target.partition(".")
+        record = self.modules[module_key]
+        if record.attribute(attribute).value == handle.optimistic:
+            self.store.apply(self.device_id, split_key(module_key)[0], record, attribute, {"value": handle.previous})
+        _LOGGER.warning("Rolled back %s of %s: %s", handle.target, self.device_id, error)
+        handle.fail(error)
+
     def turn_on_light(self, force=False):
-        if self.garageLight["lightState"]["value"] == True and not force:
+        if self.light.lightState.value == True and not force and f"{self.light.key}.lightState" not in self.pending:
             _LOGGER.debug("Light already on. No request sent.")
-            return
+            return PendingCommand.completed(f"{self.light.key}.lightState", True)
 
         _LOGGER.info("Sending Turn on Light command.")
-        self.ws.send_command("lightState", "true")
+        return self.expect("lightState", "true", "lightState", (True,), True, force)
 
     def turn_off_light(self, force=False):
-        if self.garageLight["lightState"]["value"] == False and not force:
+        if self.light.lightState.value == False and not force and f"{self.light.key}.lightState" not in self.pending:
             _LOGGER.debug("Light already off. No request sent.")
-            return True
+            return PendingCommand.completed(f"{self.light.key}.lightState", False)
 
         _LOGGER.info("Sending Turn off Light command.")
-        self.ws.send_command("lightState", "false")
+        return self.expect("lightState", "false", "lightState", (False,), False, force)
 
     def open_door(self, force=False):
-        if self.garageDoor["doorState"]["state"] == "Open" and not force:
+        doorState = self.door.doorState
+        if doorState.state == "Open" and not force and f"{self.door.key}.doorState" not in self.pending:
             _LOGGER.info("Door state already open. No request sent.")
-            return True
-        
+            return PendingCommand.completed(f"{self.door.key}.doorState", doorState.value)
+
         _LOGGER.info("Sending Open Garage Door command.")
-        self.ws.send_command("doorCommand", "1")
+        expected = (doorState.enum.index("Opening"), doorState.enum.index("Open"))
+        return self.expect("doorCommand", "1", "doorState", expected, expected[0], force)
 
     def close_door(self, force=False):
-        if self.garageDoor["doorState"]["state"] == "Closed" and not force:
+        doorState = self.door.doorState
+        if doorState.state == "Closed" and not force and f"{self.door.key}.doorState" not in self.pending:
             _LOGGER.info("Door state already closed. No request sent.")
-            return True
+            return PendingCommand.completed(f"{self.door.key}.doorState", doorState.value)
 
         _LOGGER.info("Sending Close Garage Door command.")
-        self.ws.send_command("doorCommand", "0")
+        expected = (doorState.enum.index("Closing"), doorState.enum.index("Closed"))
+        return self.expect("doorCommand", "0", "doorState", expected, expected[0], force)
 
     def set_height(self, force=False):
         pass
 
     def set_vacation_mode(self, mode=False, force=False):
         if self.vacation_mode == mode:
-            _LOGGER.info(f"Vacation mode already set to {mode}.")
+            _LOGGER.info("Vacation mode already set to %s.", mode)
             return True
 
         pass
@@ -247,3 +491,6 @@ class DeviceResponseError(Exception):
 
 class UpdateUnrecognized(Exception):
     """Class to throw failed device update response exception."""
+
+class UnknownModuleError(Exception):
+    """Class to throw when a device has no module for a command."""
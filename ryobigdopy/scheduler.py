@@ -0,0 +1,203 @@
+"""Coalescing, rate limited command scheduling for garage door openers."""
+
+import asyncio
+import logging
+import time
+import weakref
+from .helpers.constants import (
+    MIN_THROTTLE_TIME,
+    ACCOUNT_COMMAND_RATE,
+    ACCOUNT_COMMAND_BURST,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+_BUCKETS = weakref.WeakKeyDictionary()
+
+def account_bucket(auth, rate=ACCOUNT_COMMAND_RATE, capacity=ACCOUNT_COMMAND_BURST):
+    """
+    Return the token bucket shared by every device of an account.
+    rate and capacity only apply when the bucket is created.
+    """
+    bucket = _BUCKETS.get(auth)
+    if bucket is None:
+        bucket = _BUCKETS[auth] = TokenBucket(rate, capacity)
+    return bucket
+
+class TokenBucket:
+    """Allows rate commands per second on average, with bursts up to capacity."""
+
+    def __init__(self, rate=ACCOUNT_COMMAND_RATE, capacity=ACCOUNT_COMMAND_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class CommandScheduler:
+    """
+    Per-device command queue. A command queued while another for the same
+    target (e.g. doorCommand) is still waiting replaces it, so open, close,
+    open only sends the last open. Sends are spaced by min_interval and
+    take a token from the account's bucket.
+    """
+
+    def __init__(self, send, min_interval=MIN_THROTTLE_TIME, bucket=None):
+        """
+        :param send: Coroutine function send(command, value) doing the actual send.
+        :param min_interval: Minimum seconds between two sends to this device.
+        :param bucket: Optional TokenBucket shared with the account's other devices.
+        """
+        self._send = send
+        self.min_interval = min_interval
+        self.bucket = bucket
+        self._pending = {} #command: (value, [futures])
+        self._last_sent = None
+        self._worker = None
+
+    def is_pending(self, command):
+        """Return True if a command for this target is queued."""
+        return command in self._pending
+
+    def submit(self, command, value):
+        """
+        Queue a command. Returns a future with the result of the send that
+        covered it, which is a later command's if this one was replaced.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if command in self._pending:
+            _LOGGER.debug("Coalescing %s: %s -> %s", command, self._pending[command][0], value)
+            futures = self._pending.pop(command)[1] #Re-queue at the back.
+        else:
+            futures = []
+        futures.append(future)
+        self._pending[command] = (value, futures)
+
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._run())
+        return future
+
+    async def _run(self):
+        try:
+            while self._pending:
+                if self._last_sent is not None:
+                    delay = self._last_sent + self.min_interval - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if self.bucket is not None:
+                    await self.bucket.acquire()
+
+                command = next(iter(self._pending))
+                value, futures = self._pending.pop(command)
+                self._last_sent = time.monotonic()
+                try:
+                    result = await self._send(command, value)
+                except Exception as error:
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(error)
+                else:
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(result)
+        finally:
+            self._worker = None
+
+    def discard(self, command):
+        """Drop the queued command of a target. Returns False if none was queued, e.g. it was sent."""
+        queued = self._pending.pop(command, None)
+        if queued is None:
+            return False
+        for future in queued[1]:
+            future.cancel()
+        return True
+
+    def cancel(self):
+        """Drop every queued command."""
+        pending, self._pending = self._pending, {}
+        for _, futures in pending.values():
+            for future in futures:
+                future.cancel()
+        if self._worker is not None:
+            self._worker.cancel()
+
+class PendingCommand:
+    """
+    Awaitable confirmation of a command. Resolves with the reported value
+    once a notification for target carries one of the expected values,
+    or raises CommandError after rollback. Handles from completed() have
+    no future, so they can be made and read without an event loop.
+    """
+
+    def __init__(self, target, expected=(), previous=None):
+        """
+        :param target: Notification key of the attribute, e.g. garageLight_4.lightState.
+        :param expected: Values that confirm the command.
+        :param previous: Value to roll back to.
+        """
+        self.target = target
+        self.expected = expected
+        self.previous = previous
+        self.optimistic = None
+        self.command = None #Scheduler target sending the command, e.g. garageDoor_4.doorCommand.
+        self.value = None
+        self.future = asyncio.get_running_loop().create_future()
+        self.future.add_done_callback(_consume) #Failures are logged, awaiting is optional.
+        self.timer = None
+
+    @classmethod
+    def completed(cls, target, value):
+        """Return a handle already resolved with value, for when no command is sent."""
+        handle = cls.__new__(cls)
+        handle.target = target
+        handle.expected = (value,)
+        handle.previous = handle.optimistic = handle.command = None
+        handle.value = value
+        handle.future = handle.timer = None
+        return handle
+
+    def __await__(self):
+        if self.future is None:
+            return self.value
+        return (yield from self.future.__await__())
+
+    def done(self):
+        return self.future is None or self.future.done()
+
+    def result(self):
+        """Return the confirmed value, or raise what failed the command."""
+        if self.future is None:
+            return self.value
+        return self.future.result()
+
+    def resolve(self, value):
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.future is not None and not self.future.done():
+            self.future.set_result(value)
+
+    def fail(self, error):
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.future is not None and not self.future.done():
+            self.future.set_exception(error)
+
+def _consume(future):
+    if not future.cancelled():
+        future.exception()
+
+class CommandError(Exception):
+    """Class to throw when a command was not confirmed."""
+
+class CommandTimeoutError(CommandError):
+    """Class to throw when no notification confirmed a command in time."""
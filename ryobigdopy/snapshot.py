@@ -0,0 +1,326 @@
+"""
+Columnar snapshots of the state of many devices.
+
+Each column is an array.array with one row per device, serialized back
+to back, so a fleet checkpoint is a handful of buffer copies:
+
+    magic, version, rows, columns
+    per column: name, typecode, nbytes, data
+    string columns: offsets ("I", rows + 1) followed by the utf-8 blob
+
+Missing values are -1 in integer columns and NaN in float columns.
+
+value, lastValue and lastSet of the door, light and master unit attributes
+and the doorState enum are kept, so restored devices match the originals.
+Modules other than the first door, light and master unit (e.g. fans) and
+the extra attributes of registered modules are not captured.
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+from operator import attrgetter
+from .models import intern_enum
+from .ryobigdo import RyobiGDO
+
+MAGIC = b"RGDS"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHIH")
+_COLUMN = struct.Struct("<B1sI") #Name length, typecode, data length
+
+STRING = "s" #Typecode of string columns
+NAN = float("nan")
+
+#Attribute: (typecode of value and lastValue, record)
+ATTRIBUTES = {
+    "doorState": ("b", "door"),
+    "doorPercentOpen": ("h", "door"),
+    "doorPosition": ("i", "door"),
+    "vacationMode": ("b", "door"),
+    "sensorFlag": ("b", "door"),
+    "lightState": ("b", "light"),
+    "lightTimer": ("i", "light"),
+    "serialNumber": (STRING, "master"),
+    "macAddress": (STRING, "master"),
+    "appVersion": (STRING, "master"),
+}
+
+BOOL_ATTRIBUTES = frozenset(("vacationMode", "sensorFlag", "lightState"))
+
+#Column: (typecode, record, attribute, field), e.g. doorState, doorStateLastValue, doorStateLastSet
+ATTRIBUTE_COLUMNS = {}
+for _attribute, (_typecode, _record) in ATTRIBUTES.items():
+    ATTRIBUTE_COLUMNS[_attribute] = (_typecode, _record, _attribute, "value")
+    ATTRIBUTE_COLUMNS[f"{_attribute}LastValue"] = (_typecode, _record, _attribute, "lastValue")
+    ATTRIBUTE_COLUMNS[f"{_attribute}LastSet"] = ("q", _record, _attribute, "lastSet")
+del _attribute, _typecode, _record
+
+BOOL_COLUMNS = frozenset(
+    name for name, (_, _, attribute, field) in ATTRIBUTE_COLUMNS.items()
+    if attribute in BOOL_ATTRIBUTES and field != "lastSet"
+)
+
+#Column: (record, attribute) of EnumAttributes, stored as the names joined by newlines
+ENUM_COLUMNS = {
+    "doorStateEnum": ("door", "doorState"),
+}
+
+JSON_COLUMNS = frozenset(("version",)) #String columns holding json, so any value type survives.
+
+#Column: (typecode, device attribute)
+DEVICE_COLUMNS = {
+    "deviceId": (STRING, "device_id"),
+    "name": (STRING, "name"),
+    "description": (STRING, "description"),
+    "version": (STRING, "version"),
+    "lastSeen": ("q", "lastSeen"),
+    "lastUpdate": ("d", "lastUpdate"),
+}
+
+#Column: (typecode, record, module field) locating modules for commands
+MODULE_COLUMNS = {
+    "doorKey": (STRING, "door", "key"),
+    "doorModuleType": ("h", "door", "moduleType"),
+    "doorPort": ("h", "door", "port"),
+    "lightKey": (STRING, "light", "key"),
+    "lightModuleType": ("h", "light", "moduleType"),
+    "lightPort": ("h", "light", "port"),
+}
+
+def _column_paths():
+    """Yield (column, typecode, dotted attribute path on RyobiGDO) for every column."""
+    for name, (typecode, attribute) in DEVICE_COLUMNS.items():
+        yield name, typecode, attribute
+    for name, (typecode, record, attribute, field) in ATTRIBUTE_COLUMNS.items():
+        yield name, typecode, f"{record}.{attribute}.{field}"
+    for name, (typecode, record, field) in MODULE_COLUMNS.items():
+        yield name, typecode, f"{record}.{field}"
+
+class StringColumn:
+    """Strings as one utf-8 blob plus row offsets. None is kept apart from ""."""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+
+    def append(self, value):
+        self.values.append(value)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __len__(self):
+        return len(self.values)
+
+    def tobytes(self):
+        offsets = array("I", [0])
+        nulls = array("b")
+        blob = bytearray()
+        for value in self.values:
+            nulls.append(value is None)
+            blob += b"" if value is None else str(value).encode()
+            offsets.append(len(blob))
+        return _native(offsets).tobytes() + _native(nulls).tobytes() + bytes(blob)
+
+    @classmethod
+    def frombytes(cls, data, rows):
+        offsets = _native(array("I", data[:4 * (rows + 1)]))
+        nulls = array("b", data[4 * (rows + 1):5 * rows + 4])
+        blob = data[5 * rows + 4:]
+        return cls(
+            None if nulls[row] else blob[offsets[row]:offsets[row + 1]].decode()
+            for row in range(rows)
+        )
+
+def _native(values):
+    """Byte swap to or from the little endian file layout on big endian hosts."""
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+class FleetSnapshot:
+    """State of many devices, one array per column."""
+
+    def __init__(self, columns, rows):
+        """
+        :param columns: {name: (typecode, array.array or StringColumn)}
+        :param rows: Number of devices.
+        """
+        self.columns = columns
+        self.rows = rows
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        return self.columns[name][1]
+
+    @classmethod
+    def capture(cls, devices):
+        """Take a snapshot of devices, a column at a time."""
+        devices = list(devices)
+        columns = {}
+        for name, typecode, path in _column_paths():
+            values = list(map(attrgetter(path), devices))
+            if name in JSON_COLUMNS:
+                columns[name] = (typecode, StringColumn(None if value is None else json.dumps(value) for value in values))
+            elif typecode == STRING:
+                columns[name] = (typecode, StringColumn(values))
+            elif typecode == "d":
+                columns[name] = (typecode, array(typecode, [NAN if value is None else value for value in values]))
+            else:
+                columns[name] = (typecode, array(typecode, [-1 if value is None else int(value) for value in values]))
+        for name, (record, attribute) in ENUM_COLUMNS.items():
+            values = map(attrgetter(f"{record}.{attribute}.enum"), devices)
+            columns[name] = (STRING, StringColumn("\n".join(value) for value in values))
+        return cls(columns, len(devices))
+
+    def tobytes(self):
+        parts = [_HEADER.pack(MAGIC, VERSION, self.rows, len(self.columns))]
+        for name, (typecode, column) in self.columns.items():
+            data = column.tobytes() if typecode == STRING else _native(array(typecode, column)).tobytes()
+            encoded_name = name.encode()
+            parts.append(_COLUMN.pack(len(encoded_name), typecode.encode(), len(data)))
+            parts.append(encoded_name)
+            parts.append(data)
+        return b"".join(parts)
+
+    @classmethod
+    def frombytes(cls, data):
+        view = memoryview(data)
+        magic, version, rows, count = _HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"Not a version {VERSION} fleet snapshot.")
+        offset = _HEADER.size
+        columns = {}
+        for _ in range(count):
+            name_length, typecode, length = _COLUMN.unpack_from(view, offset)
+            offset += _COLUMN.size
+            name = bytes(view[offset:offset + name_length]).decode()
+            offset += name_length
+            chunk = bytes(view[offset:offset + length])
+            offset += length
+            typecode = typecode.decode()
+            if typecode == STRING:
+                columns[name] = (typecode, StringColumn.frombytes(chunk, rows))
+            else:
+                columns[name] = (typecode, _native(array(typecode, chunk)))
+        return cls(columns, rows)
+
+    def save(self, path):
+        """Write the snapshot atomically."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(self.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls.frombytes(file.read())
+
+    def decoded(self, name):
+        """Return a column as a list with None for missing values."""
+        typecode, column = self.columns[name]
+        if name in JSON_COLUMNS and typecode == STRING:
+            return [None if value is None else json.loads(value) for value in column.values]
+        if name in ENUM_COLUMNS:
+            return [None if value is None else intern_enum(value.split("\n") if value else ()) for value in column.values]
+        if typecode == STRING:
+            return column.values
+        if typecode == "d":
+            return [None if value != value else value for value in column]
+        if name in BOOL_COLUMNS:
+            return [None if value == -1 else bool(value) for value in column]
+        return [None if value == -1 else value for value in column]
+
+    def apply(self, devices):
+        """
+        Set the state of devices from the rows with their ids, a column at a
+        time. No change events are emitted. Returns the number of devices set.
+        """
+        by_id = {device.device_id: device for device in devices}
+        targets = [by_id.get(device_id) for device_id in self.column("deviceId")]
+
+        def rows(name):
+            if name not in self.columns:
+                return ()
+            return [(device, value) for device, value in zip(targets, self.decoded(name)) if device is not None]
+
+        for name in ("doorKey", "lightKey"):
+            for device, key in rows(name):
+                if key is not None:
+                    device.module(key)
+        for device, serial in rows("serialNumber"):
+            if serial is not None:
+                device.module("masterUnit")
+        for name, (typecode, record, field) in MODULE_COLUMNS.items():
+            if typecode != STRING:
+                for device, value in rows(name):
+                    if value is not None:
+                        setattr(getattr(device, record), field, value)
+        for name, (typecode, record, attribute, field) in ATTRIBUTE_COLUMNS.items():
+            getter = attrgetter(f"{record}.{attribute}")
+            for device, value in rows(name):
+                setattr(getter(device), field, value)
+        for name, (record, attribute) in ENUM_COLUMNS.items():
+            getter = attrgetter(f"{record}.{attribute}")
+            for device, enum in rows(name):
+                if enum is not None:
+                    getter(device).enum = enum
+        for name, (typecode, attribute) in DEVICE_COLUMNS.items():
+            if name != "deviceId":
+                for device, value in rows(name):
+                    setattr(device, attribute, value)
+        return sum(target is not None for target in targets)
+
+    def restore(self, auth=None, store=None, directory=None):
+        """Create a RyobiGDO per row without network calls. Returns the devices."""
+        devices = [
+            RyobiGDO(auth, device_id, directory=directory, store=store, fetch=False)
+            for device_id in self.column("deviceId")
+        ]
+        self.apply(devices)
+        return devices
+
+    def to_numpy(self):
+        """Return {column: numpy array}. Numeric columns share the snapshot buffers."""
+        import numpy
+        return {
+            name: numpy.array(column.values, dtype=object) if typecode == STRING else numpy.frombuffer(column, dtype=column.typecode)
+            for name, (typecode, column) in self.columns.items()
+        }
+
+    def to_arrow(self):
+        """Return a pyarrow.Table, with missing values as nulls."""
+        import pyarrow
+        arrays = {}
+        for name, (typecode, column) in self.columns.items():
+            if typecode == STRING:
+                arrays[name] = pyarrow.array(column.values, type=pyarrow.string())
+            else:
+                arrays[name] = pyarrow.array(self.decoded(name))
+        return pyarrow.table(arrays)
+
+def snapshot(devices, path=None):
+    """Capture a FleetSnapshot of devices, also written to path if given."""
+    fleet_snapshot = FleetSnapshot.capture(devices)
+    if path is not None:
+        fleet_snapshot.save(path)
+    return fleet_snapshot
+
+def restore(source, auth=None, store=None, directory=None):
+    """
+    Recreate devices from a FleetSnapshot, its bytes or a file path.
+    :return: List of RyobiGDO.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = FleetSnapshot.frombytes(source)
+    elif not isinstance(source, FleetSnapshot):
+        source = FleetSnapshot.load(source)
+    return source.restore(auth, store, directory)
+
+class SnapshotError(Exception):
+    """Class to throw unreadable snapshot exception."""
@@ -0,0 +1,81 @@
+"""Versioned device state store emitting change events."""
+
+import logging
+import time
+from collections import namedtuple
+from .models import EnumAttribute
+
+_LOGGER = logging.getLogger(__name__)
+
+ChangeEvent = namedtuple(
+    "ChangeEvent",
+    "seq device_id module attribute old new old_state new_state timestamp",
+)
+ChangeEvent.__doc__ = """
+A changed attribute value. old_state/new_state hold the enum names
+(e.g. Closed -> Opening) for enum attributes and None otherwise.
+"""
+
+class StateStore:
+    """
+    Applies updates to module records as deltas. Each changed value bumps
+    a monotonic sequence number and is sent to the matching subscribers.
+    One store can be shared by many devices.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self._subscribers = []
+
+    def subscribe(self, callback, attributes=None, device_id=None):
+        """
+        Call callback(event) for every change.
+        :param attributes: Optional attribute names (e.g. {"doorState"}) to filter on.
+        :param device_id: Optional device to filter on.
+        :return: Function that removes the subscription.
+        """
+        subscriber = (callback, None if attributes is None else frozenset(attributes), device_id)
+        self._subscribers.append(subscriber)
+        return lambda: self._subscribers.remove(subscriber)
+
+    def apply(self, device_id, module, record, name, update):
+        """
+        Apply an API attribute update to record.name.
+        :return: The ChangeEvent, or None if the value did not change.
+        """
+        attribute = record.attribute(name, update)
+        old = attribute.value
+        attribute.update(update)
+        if attribute.value == old:
+            return None
+
+        self.seq += 1
+        if isinstance(attribute, EnumAttribute):
+            old_state = attribute.enum[old] if isinstance(old, int) and 0 <= old < len(attribute.enum) else None
+            new_state = attribute.state
+        else:
+            old_state = new_state = None
+        event = ChangeEvent(self.seq, device_id, module, name, old, attribute.value, old_state, new_state, time.time())
+        self.emit(event)
+        return event
+
+    def load(self, device_id, module, record, attributes):
+        """Apply a deviceTypeMap module's "at" dict. Returns the ChangeEvents."""
+        events = []
+        for name, data in attributes.items():
+            if record.accepts(name):
+                event = self.apply(device_id, module, record, name, data)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def emit(self, event):
+        for callback, attributes, device_id in list(self._subscribers):
+            if attributes is not None and event.attribute not in attributes:
+                continue
+            if device_id is not None and event.device_id != device_id:
+                continue
+            try:
+                callback(event)
+            except Exception: #A subscriber must not break state updates.
+                _LOGGER.exception("State subscriber failed on %s", event)
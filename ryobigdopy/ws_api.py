@@ -1,11 +1,28 @@
 """Implements known ryobigdo Websocket commands."""
 
-import json
+import asyncio
+import itertools
 import logging
+import random
+import time
 import traceback
-from json import dumps
-from helpers.constants import WS_ENDPOINT, WS_MAXRETRY
-import websockets
+from collections import deque
+from .auth import LoginError
+from .helpers.constants import (
+    WS_MAXRETRY,
+    WS_TIMEOUT,
+    WS_COMMAND_TIMEOUT,
+    WS_BACKOFF_BASE,
+    WS_BACKOFF_MAX,
+    WS_BREAKER_COOLDOWN,
+    WS_PING_INTERVAL,
+    WS_PING_TIMEOUT,
+    WS_QUEUE_SIZE,
+    WS_QUEUE_BACKLOG,
+)
+from .helpers import frames
+from .helpers import json_backend
+from . import metrics
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -15,22 +32,174 @@ SIGNAL_WEBSOCKET_MESSAGE = "ryobiwebsocket_message" #Callback websocket message
 STATE_NOT_STARTED = "not_started" #Represents a state where the socket hasn't attempted to start.
 STATE_STARTING = "starting" #Represents a state where the socket is in the process of becoming STATE_CONNECTED
 STATE_CONNECTED = "connected" #Represents a state where the socket is connected, authenticated, and subscribed.
-STATE_STOPPED = "stopped" #Represents a state where the socket was intentionally stopped, sometimes as a result of MAX_FAILED_ATTEMPTS.
+STATE_STOPPED = "stopped" #Represents a state where the socket was intentionally stopped with close().
 STATE_CLOSED = "closed" #Represents a state where the socket was closed by the server (sometimes due to a connection error)
 STATE_ERROR = "error" #Represents a state where the socket/api encountered an error. Should retry connection.
 
+FAILURE_CLOSED = "closed" #Connection closed by the server or the network.
+FAILURE_AUTH = "auth_failed" #API key rejected by srvWebSocketAuth.
+FAILURE_LOGIN = "login_failed" #No new API key could be fetched.
+FAILURE_TIMEOUT = "timeout" #Connect, auth or subscribe not answered in time.
+FAILURE_CONNECT = "connect_failed" #Could not open the socket, or a request failed.
+FAILURE_ERROR = "error" #Anything unexpected.
+
+POLICY_BLOCK = "block" #Full queue holds notifications past maxsize, up to a backlog, then the reader pauses.
+POLICY_DROP_OLDEST = "drop_oldest" #Full queue drops its oldest notification of this policy.
+POLICY_COALESCE = "coalesce" #Queued notifications for a topic merge, keeping the latest value per attribute.
+
+def notify_topic(device_id):
+    """Return the attribute update topic for a device."""
+    return f"{device_id}.wskAttributeUpdateNtfy"
+
+def message_device_id(data):
+    """Return the device id a websocket notification belongs to."""
+    params = data.get("params") or {}
+    device_id = params.get("varName")
+    if device_id is None and "topic" in params:
+        device_id = params["topic"].partition(".")[0]
+    return device_id
+
+def failure_cause(error):
+    """Return the FAILURE_* cause of a failed connect, authenticate or subscribe."""
+    if isinstance(error, (asyncio.TimeoutError, WebsocketTimeoutError)):
+        return FAILURE_TIMEOUT
+    if isinstance(error, LoginError):
+        return FAILURE_LOGIN
+    return FAILURE_CONNECT
+
+class NotificationQueue:
+    """
+    Bounded queue between the socket reader and the callback dispatcher.
+    What happens on overflow is chosen per topic or method. Replies are
+    resolved by the reader before anything is queued, so they only wait
+    while the reader is paused by a full backlog.
+    """
+
+    def __init__(self, maxsize=WS_QUEUE_SIZE, policies=None, default=POLICY_BLOCK, backlog=WS_QUEUE_BACKLOG):
+        """
+        :param policies: {topic or method: POLICY_*}, e.g.
+                         {"wskAttributeUpdateNtfy": POLICY_COALESCE}.
+        :param default: Policy for anything not in policies.
+        :param backlog: Notifications held past maxsize before full() is True.
+        """
+        self.maxsize = maxsize
+        self.policies = {} if policies is None else policies
+        self.default = default
+        self.backlog = backlog
+        self.high_water = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.held = 0
+        self._items = deque()
+        self._latest = {} #topic: queued notification still open for merging
+        self._ready = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+
+    def __len__(self):
+        return len(self._items)
+
+    def policy(self, data):
+        params = data.get("params") or {}
+        return self.policies.get(params.get("topic"), self.policies.get(data.get("method"), self.default))
+
+    def full(self):
+        """Return True once the backlog is used up and the reader should pause."""
+        return len(self._items) >= self.maxsize + self.backlog
+
+    def offer(self, data):
+        """Queue a notification without waiting, applying its overflow policy."""
+        policy = self.policy(data)
+        topic = (data.get("params") or {}).get("topic")
+        if policy == POLICY_COALESCE and topic is not None:
+            queued = self._latest.get(topic)
+            if queued is not None:
+                queued["params"].update(data["params"])
+                self.coalesced += 1
+                return
+
+        if len(self._items) >= self.maxsize:
+            if policy == POLICY_DROP_OLDEST and self._drop_oldest():
+                self.dropped += 1
+            else:
+                self.held += 1 #In order past maxsize, nothing is dropped.
+        self._items.append(data)
+        if policy == POLICY_COALESCE and topic is not None:
+            self._latest[topic] = data
+        self.high_water = max(self.high_water, len(self._items))
+        if self.full():
+            self._room.clear()
+        self._ready.set()
+
+    def _drop_oldest(self):
+        """Drop the oldest queued notification with POLICY_DROP_OLDEST. Returns False if there is none."""
+        for index, data in enumerate(self._items):
+            if self.policy(data) == POLICY_DROP_OLDEST:
+                del self._items[index]
+                self._forget(data)
+                return True
+        return False
+
+    async def room(self):
+        """Wait until the queue is back down to maxsize, after full()."""
+        await self._room.wait()
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        data = self._items.popleft()
+        self._forget(data)
+        if len(self._items) <= self.maxsize:
+            self._room.set()
+        return data
+
+    def _forget(self, data):
+        topic = (data.get("params") or {}).get("topic")
+        if self._latest.get(topic) is data:
+            del self._latest[topic]
+
+    def stats(self):
+        """Return queue depth metrics."""
+        return {
+            "depth": len(self._items),
+            "high_water": self.high_water,
+            "maxsize": self.maxsize,
+            "backlog": self.backlog,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "held": self.held,
+        }
+
 class RyobiWebsocket:
 
-    def __init__(self, callback, auth, device_id):
+    def __init__(self, callback, auth, device_id=None, queue_size=WS_QUEUE_SIZE, overflow=None):
+        """
+        :param callback: callback(signal, data, error) for state and notifications.
+        :param queue_size: Notifications buffered for the callback.
+        :param overflow: {topic or method: POLICY_*} for a full queue, default POLICY_BLOCK.
+        """
         self.conn = None
         self.callback = callback
         self.auth = auth
         self.device_id = device_id
+        self.device_ids = [] if device_id is None else [device_id]
         self._is_auth = False
         self._is_notify = False
         self._error_reason = None
         self.state = STATE_NOT_STARTED
-        self.failed_attempts = None
+        self.failed_attempts = 0
+        self.breaker_open = False
+        self._relogin = False
+        self._stop_event = None
+        self._loop = None #Loop running listen(), for close() from other threads.
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._auth_body = None #(api_key, srvWebSocketAuth body) of the current key.
+        self._added = [] #Devices added while connected, waiting for their subscribe batch.
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.queue = None
 
     @property
     def state(self):
@@ -46,103 +215,287 @@ class RyobiWebsocket:
         self._error_reason = None
 
     async def running(self):
+        """Run one connection: connect, authenticate, subscribe and read until it drops."""
+        import websockets #Not imported with the module, HTTP only users never load it.
+        reader = None
         try:
+            if self._relogin or self.auth.api_key is None:
+                await self.relogin()
+            if self.state is STATE_STOPPED: #close() during the login.
+                return
+
             self.state = STATE_STARTING
             _LOGGER.info("Starting websocket connection...")
-            async for self.conn in websockets.connect(WS_ENDPOINT):
-                if self.check_retries(): break
-
-                try:
-                    _LOGGER.debug("is Auth: %s. is Notify: %s", self._is_auth, self._is_notify)
-                    if self._is_auth is False:
-                        if not await self.send_auth_message():
-                            raise WebsocketConnectionError("Authentication failed.")
-
-                    if self._is_notify is False:
-                        if not await self.send_subscribe_message():
-                            raise WebsocketConnectionError("Subscribing to updates failed.")
-
-                    _LOGGER.info("Websocket connected, authenticated, and subscribed to device.")
-                    self.state = STATE_CONNECTED
-
-                    while True:
-                        async for message in self.conn:
-                            _LOGGER.debug("Message: %s", message)
-                            self.callback(SIGNAL_WEBSOCKET_MESSAGE, json.loads(message))
-                            #process message
-                        if self.state is STATE_STOPPED:
-                            _LOGGER.info("Closing websocket...")
-                            await self.conn.close()
-                            break
-
-                except websockets.ConnectionClosed:
-                    _LOGGER.warning(f"Websocket connection closed. Retrying... {self.failed_attempts}")
-                    self._error_reason = f"Websocket connection closed. Retrying... {self.failed_attempts}"
-                    self.state = STATE_CLOSED
-                    self.failed_attempts += 1
-                    self._is_notify = False
-                    self._is_auth = False
-                    continue
+            started = time.perf_counter()
+            async with websockets.connect(
+                self.auth.ws_endpoint,
+                ping_interval=WS_PING_INTERVAL, #Unanswered pings close the socket.
+                ping_timeout=WS_PING_TIMEOUT,
+                open_timeout=WS_TIMEOUT,
+            ) as self.conn:
+                if self.state is STATE_STOPPED: #close() while connecting, drop the new socket.
+                    return
+                reader = asyncio.ensure_future(self.receive())
+                with metrics.span("ryobigdo.ws_handshake", devices=len(self.device_ids)):
+                    if not await self.send_auth_message():
+                        raise WebsocketAuthError("Authentication failed.")
 
-                except WebsocketConnectionError as error:
-                    _LOGGER.warning(f"Failed to authenticate or subscribe. Retrying... {self.failed_attempts}")
-                    self._error_reason = error
-                    self.state = STATE_ERROR
-                    self.failed_attempts += 1
-                    self._is_notify = False
-                    self._is_auth = False
-                    continue
+                    if not await self.send_subscribe_message():
+                        raise WebsocketConnectionError("Subscribing to updates failed.")
+                if self.state is STATE_STOPPED:
+                    return
+
+                _LOGGER.info("Websocket connected, authenticated, and subscribed to device.")
+                if metrics.ENABLED:
+                    metrics.WS_CONNECT_SECONDS.observe(time.perf_counter() - started)
+                self.failed_attempts = 0
+                self.breaker_open = False
+                self.state = STATE_CONNECTED
+
+                await reader #Returns when the socket closes cleanly.
+                if self.state is not STATE_STOPPED:
+                    raise websockets.ConnectionClosed(None, None)
+                _LOGGER.info("Closing websocket...")
+
+        except websockets.ConnectionClosed:
+            self.failed(STATE_CLOSED, f"Websocket connection closed. Retrying... {self.failed_attempts}", FAILURE_CLOSED)
+
+        except WebsocketAuthError as error:
+            self._relogin = True #Only a rejected API key warrants a new login.
+            self._auth_body = None
+            if hasattr(self.auth, "reject_api_key"):
+                self.auth.reject_api_key()
+            self.failed(STATE_ERROR, error, FAILURE_AUTH)
+
+        except (WebsocketConnectionError, LoginError, OSError, asyncio.TimeoutError) as error:
+            self.failed(STATE_ERROR, f"Failed to connect, authenticate or subscribe: {error!r}", failure_cause(error))
 
         except Exception as error:
             def get_traceback(e):
                 return ''.join(traceback.format_exception(type(e), e, e.__traceback__))
             _LOGGER.error("Unhandled exception occured: %s", get_traceback(error))
-            self.failed_attempts += 1
-            self._error_reason = error
-            self.state = STATE_ERROR
+            self.failed(STATE_ERROR, error, FAILURE_ERROR)
+
+        finally:
+            if reader is not None:
+                reader.cancel()
+            self.fail_pending(WebsocketConnectionError("Websocket connection lost."))
             self._is_notify = False
             self._is_auth = False
 
+    def failed(self, state, reason, cause=FAILURE_ERROR):
+        """
+        Record a failed attempt, unless the socket was closed on purpose.
+        :param reason: Message passed to the callback.
+        :param cause: FAILURE_* label of the reconnect metric.
+        """
+        if self.state is STATE_STOPPED:
+            return
+        _LOGGER.warning("%s", reason)
+        if metrics.ENABLED:
+            metrics.WS_RECONNECTS.inc(reason=cause)
+        self.failed_attempts += 1
+        self._error_reason = reason
+        self.state = state
+
+    async def relogin(self):
+        """Get a new API key through Auth.login."""
+        _LOGGER.info("Logging in for a new API key.")
+        if asyncio.iscoroutinefunction(self.auth.login):
+            await self.auth.login()
+        else:
+            await asyncio.get_event_loop().run_in_executor(None, self.auth.login)
+        self._relogin = False
+
+    async def receive(self):
+        """Read frames, resolving pending requests and relaying notifications."""
+        try:
+            async for message in self.conn:
+                _LOGGER.debug("Message: %s", message)
+                if metrics.ENABLED:
+                    metrics.WS_FRAMES.inc(direction="in")
+                    started = time.perf_counter()
+                    data = json_backend.loads(message)
+                    metrics.WS_DECODE_SECONDS.observe(time.perf_counter() - started)
+                else:
+                    data = json_backend.loads(message)
+                future = self._pending.pop(data.get("id"), None)
+                if future is not None:
+                    if not future.done():
+                        future.set_result(data)
+                    continue
+                if "method" not in data: #Reply nobody is waiting for anymore.
+                    _LOGGER.debug("Unmatched reply: %s", data)
+                    continue
+                if data["method"] == "authorizedWebSocket": #Sent before the srvWebSocketAuth reply, which is what we check.
+                    continue
+                if self.queue is None:
+                    self.relay(data)
+                else:
+                    self.queue.offer(data)
+                    if self.queue.full(): #Backpressure once the backlog is used up.
+                        await self.queue.room()
+        finally:
+            self.fail_pending(WebsocketConnectionError("Websocket connection lost."))
+
+    async def dispatch(self):
+        """Hand queued notifications to the callback, apart from the reader."""
+        while True:
+            data = await self.queue.get()
+            try:
+                self.relay(data)
+            except Exception: #A failing callback must not stop the dispatcher.
+                _LOGGER.exception("Websocket callback failed on %s", data)
+
+    def relay(self, data):
+        """Pass a notification to the callback."""
+        if not metrics.ENABLED:
+            return self.callback(SIGNAL_WEBSOCKET_MESSAGE, data)
+        started = time.perf_counter()
+        try:
+            return self.callback(SIGNAL_WEBSOCKET_MESSAGE, data)
+        finally:
+            metrics.WS_CALLBACK_SECONDS.observe(time.perf_counter() - started)
+
+    def queue_stats(self):
+        """Return notification queue metrics, or None before listen()."""
+        return None if self.queue is None else self.queue.stats()
+
+    async def send_frames(self, messages):
+        """
+        Write frames back to back. The library only waits for the socket to
+        drain once its write buffer is full, so a batch goes out together.
+        """
+        send = self.conn.send
+        count = 0
+        for message in messages:
+            await send(message)
+            count += 1
+        if metrics.ENABLED:
+            metrics.WS_FRAMES.inc(count, direction="out")
+
+    async def request(self, method, params, timeout=WS_TIMEOUT, body=None):
+        """
+        Send a JSON-RPC request and wait for the reply carrying its id.
+        :param body: Cached frames body to send instead of serializing params.
+        """
+        request_id = next(self._ids)
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self.conn.send(frames.frame(request_id, frames.body(method, params) if body is None else body))
+            if metrics.ENABLED:
+                metrics.WS_FRAMES.inc(direction="out")
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError as error:
+            raise WebsocketTimeoutError(f"No reply to {method} ({request_id}) after {timeout}s.") from error
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def request_many(self, method, bodies, timeout=WS_TIMEOUT):
+        """
+        Send a batch of requests of one method and wait for every reply.
+        :param bodies: Cached frames bodies, one per request.
+        :return: Replies in the order of bodies.
+        """
+        loop = asyncio.get_event_loop()
+        request_ids = []
+        futures = []
+        messages = []
+        for body in bodies:
+            request_id = next(self._ids)
+            future = loop.create_future()
+            self._pending[request_id] = future
+            request_ids.append(request_id)
+            futures.append(future)
+            messages.append(frames.frame(request_id, body))
+        try:
+            await self.send_frames(messages)
+            return await asyncio.wait_for(asyncio.gather(*futures), timeout)
+        except asyncio.TimeoutError as error:
+            raise WebsocketTimeoutError(f"No reply to {len(messages)} {method} request(s) after {timeout}s.") from error
+        finally:
+            for request_id in request_ids:
+                self._pending.pop(request_id, None)
+
+    def fail_pending(self, error):
+        """Fail every request still waiting for a reply."""
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def auth_body(self):
+        """Return the srvWebSocketAuth body, rebuilt when the API key changes."""
+        api_key = self.auth.api_key
+        if self._auth_body is None or self._auth_body[0] != api_key:
+            self._auth_body = (api_key, frames.auth_body(self.auth.username, api_key))
+        return self._auth_body[1]
+
     async def send_auth_message(self):
         _LOGGER.debug("Sending Authentication message.")
-        await self.conn.send(json.dumps(
-            {'jsonrpc': '2.0',
-            'id': 3,
-            'method': 'srvWebSocketAuth',
-            'params': {
-                'varName': self.auth.username,
-                'apiKey': self.auth.api_key
-                }
-            }))
-        _LOGGER.debug("Throw away first reply: %s", await self.conn.recv()) #Throw away first reply
-        auth_response = json.loads(await self.conn.recv())
+        auth_response = await self.request('srvWebSocketAuth', None, body=self.auth_body())
         _LOGGER.debug("Recieving after auth: %s", auth_response)
-        if auth_response["result"]["authorized"] is True:
+        if auth_response.get("result", {}).get("authorized") is True:
             _LOGGER.info("User authenticated successfully.")
             self._is_auth = True
             return True
         return False
     #'{"jsonrpc":"2.0","result":{"authorized":true,"varName":"USER@NAME","aCnt":0},"id":3}'
     
-    async def send_subscribe_message(self):
-        _LOGGER.debug("Sending Subscribe message.")
-        await self.conn.send(json.dumps(
-            {'jsonrpc': '2.0',
-            'id': 3,
-            'method': 'wskSubscribe',
-            'params': {
-                "topic": f"{self.device_id}.wskAttributeUpdateNtfy"
-                }
-            }))
-        notify_response = json.loads(await self.conn.recv())
-        _LOGGER.debug("Recieving after subscribe: %s", notify_response)
-        if notify_response["result"]["result"] == "OK":
-            _LOGGER.info("User subscribed successfully.")
-            self._is_notify = True
-            return True
-        return False
+    async def send_subscribe_message(self, device_ids=None):
+        """Subscribe to updates for all (or the given) devices in one batch."""
+        if device_ids is None:
+            device_ids = list(self.device_ids)
+        _LOGGER.debug("Sending Subscribe message for %s device(s).", len(device_ids))
+        notify_responses = await self.request_many(
+            'wskSubscribe',
+            [frames.subscribe_body(notify_topic(device_id)) for device_id in device_ids],
+        )
+        _LOGGER.debug("Recieving after subscribe: %s", notify_responses)
+        for notify_response in notify_responses:
+            if notify_response.get("result", {}).get("result") != "OK":
+                return False
+
+        _LOGGER.info("User subscribed successfully to %s device(s).", len(device_ids))
+        self._is_notify = True
+        return True
     #{'jsonrpc': '2.0', 'result': {'result': 'OK', 'aCnt': 0}, 'id': 3}
 
+    def add_device(self, device_id):
+        """Add a device to this connection, subscribing now if already connected."""
+        if device_id in self.device_ids:
+            return
+        self.device_ids.append(device_id)
+        if self.state is STATE_CONNECTED:
+            self._added.append(device_id)
+            if len(self._added) == 1: #Devices added before the task runs share its batch.
+                asyncio.ensure_future(self.subscribe_added())
+
+    async def subscribe_added(self):
+        """
+        Subscribe devices added while connected in one batch. If that fails
+        the connection is dropped, and the reconnect subscribes every device.
+        """
+        added, self._added = self._added, []
+        device_ids = [device_id for device_id in added if device_id in self.device_ids]
+        if not device_ids or self.state is not STATE_CONNECTED:
+            return #The next connect subscribes them.
+        try:
+            if await self.send_subscribe_message(device_ids):
+                return
+            error = "rejected"
+        except Exception as exception:
+            error = repr(exception)
+        _LOGGER.warning("Subscribing %s added device(s) failed: %s. Reconnecting.", len(device_ids), error)
+        if self.state is STATE_CONNECTED and self.conn is not None:
+            await self.conn.close()
+
+    def remove_device(self, device_id):
+        """Stop tracking a device. It is not resubscribed on the next reconnect."""
+        if device_id in self.device_ids:
+            self.device_ids.remove(device_id)
+
     async def send_msg(self, msg):
         if self.state is STATE_CONNECTED:
             await self.conn.send(msg)
@@ -150,39 +503,152 @@ class RyobiWebsocket:
         else:
             return False
 
-    async def send_command(self, command, value):
-        if self.state is STATE_CONNECTED:
-            await self.conn.send(json.dumps(
-                {'jsonrpc': '2.0',
-                'method': 'gdoModuleCommand',
-                'params':
-                    {'msgType': 16,
-                    'moduleType': 5,
-                    'portId': 7, #check if protId same for light/door/modules.
-                    'moduleMsg': 
-                        {command: value},
-                    'topic': self.device_id}
-                }))
-        #probably check that it worked? Maybe use some kind of Queue that waits for a response and checks against expected otherwise callback? Could revamp sendauth/sendnotify.
+    async def send_command(self, command, value, device_id=None, timeout=WS_COMMAND_TIMEOUT, *, module_type, port_id):
+        """
+        Send a module command.
+        :param timeout: Seconds to wait for the acknowledgement, which is
+                        returned. None sends without waiting and returns True.
+        :param module_type: moduleType of the target module (its moduleId).
+        :param port_id: portId of the target module, e.g. 7 for garageDoor_7.
+        """
+        if device_id is None:
+            device_id = self.device_id
+        if self.state is not STATE_CONNECTED:
+            return False
+
+        body = frames.command_body(device_id, command, value, module_type, port_id)
+        if timeout is None:
+            await self.send_frames((frames.frame(next(self._ids), body),))
+            return True
+        return await self.request('gdoModuleCommand', None, timeout, body=body)
+
+    async def send_commands(self, commands, timeout=WS_COMMAND_TIMEOUT):
+        """
+        Send many module commands in one batch.
+        :param commands: Iterable of (device_id, command, value, module_type, port_id).
+        :param timeout: Seconds to wait for all acknowledgements, which are
+                        returned in order. None sends without waiting and returns True.
+        """
+        if self.state is not STATE_CONNECTED:
+            return False
+        bodies = [frames.command_body(*command) for command in commands]
+        if timeout is None:
+            await self.send_frames([frames.frame(next(self._ids), body) for body in bodies])
+            return True
+        return await self.request_many('gdoModuleCommand', bodies, timeout)
 
     async def listen(self):
+        """Keep the websocket connected until close() is called."""
         self.failed_attempts = 0
-        while self.state != STATE_STOPPED:
-            if self.check_retries(): break
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self.queue = NotificationQueue(self.queue_size, self.overflow)
+        dispatcher = asyncio.ensure_future(self.dispatch())
+        while self.state is not STATE_STOPPED:
             await self.running()
+            if self.state is STATE_STOPPED:
+                break
+
+            delay = self.retry_delay()
+            _LOGGER.debug("Reconnecting in %.1fs (attempt %s).", delay, self.failed_attempts)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
 
+        dispatcher.cancel()
         _LOGGER.info("Websocket loop stopped.")
 
     def close(self):
-        """Close the listening websocket."""
+        """Close the listening websocket. Can be called from any thread, e.g. to stop a sync connect_ws()."""
         self.state = STATE_STOPPED
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop)
+
+    def _stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self.conn is not None:
+            asyncio.ensure_future(self.conn.close())
+
+    def retry_delay(self):
+        """Exponential backoff with equal jitter, or the breaker cool-down."""
+        if self.check_retries():
+            cap = WS_BREAKER_COOLDOWN
+        else:
+            cap = min(WS_BACKOFF_MAX, WS_BACKOFF_BASE * 2 ** self.failed_attempts)
+        return cap / 2 + random.uniform(0, cap / 2)
     
     def check_retries(self):
+        """
+        Open the circuit breaker after WS_MAXRETRY consecutive failures.
+        The supervisor keeps trying, just less often, until a connect succeeds.
+        """
         if self.failed_attempts > WS_MAXRETRY:
-            _LOGGER.debug("Connection stopped after too many retries (%s).", self.failed_attempts)
-            self._error_reason = f"Connection stopped after too many retries (%s).", self.failed_attempts
-            self.state = STATE_STOPPED
+            if not self.breaker_open:
+                _LOGGER.warning("Connection failing after %s attempts, backing off.", self.failed_attempts)
+                self.breaker_open = True
+            return True
+        return False
+
+class RyobiWebsocketHub:
+    """Share one authenticated websocket between many devices of an account."""
+
+    def __init__(self, auth, queue_size=WS_QUEUE_SIZE, overflow=None):
+        self.auth = auth
+        self.callbacks = {}
+        self.ws = RyobiWebsocket(self.dispatch, auth, queue_size=queue_size, overflow=overflow)
+
+    @property
+    def state(self):
+        """Return the state of the shared connection."""
+        return self.ws.state
+
+    def register(self, device_id, callback):
+        """Route updates for device_id to callback and subscribe to its topic."""
+        self.callbacks[device_id] = callback
+        callback(SIGNAL_CONNECTION_STATE, self.ws.state, None)
+        self.ws.add_device(device_id)
+
+    def unregister(self, device_id):
+        """Stop routing updates for device_id."""
+        self.callbacks.pop(device_id, None)
+        self.ws.remove_device(device_id)
+
+    def dispatch(self, topic, data, error=None):
+        """Relay state to every device and notifications to their owner."""
+        if topic is SIGNAL_CONNECTION_STATE:
+            for callback in list(self.callbacks.values()):
+                callback(topic, data, error)
             return True
 
+        device_id = message_device_id(data)
+        callback = self.callbacks.get(device_id)
+        if callback is None:
+            _LOGGER.debug("No device registered for message: %s", data)
+            return False
+        return callback(topic, data, error)
+
+    async def send_command(self, device_id, command, value, timeout=WS_COMMAND_TIMEOUT, *, module_type, port_id):
+        return await self.ws.send_command(
+            command, value, device_id, timeout, module_type=module_type, port_id=port_id
+        )
+
+    async def send_commands(self, commands, timeout=WS_COMMAND_TIMEOUT):
+        return await self.ws.send_commands(commands, timeout)
+
+    async def listen(self):
+        await self.ws.listen()
+
+    def close(self):
+        """Close the shared websocket."""
+        self.ws.close()
+
 class WebsocketConnectionError(Exception):
-    """Class to throw an unauthorized access error."""
\ No newline at end of file
+    """Class to throw an unauthorized access error."""
+
+class WebsocketAuthError(WebsocketConnectionError):
+    """Class to throw when the server rejects the API key."""
+
+class WebsocketTimeoutError(WebsocketConnectionError):
+    """Class to throw when a request is not answered in time."""
\ No newline at end of file
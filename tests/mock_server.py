@@ -0,0 +1,243 @@
+"""
+Offline stand-in for the Ryobi HTTP API and wsrpc websocket.
+
+Serves /api/login, /api/devices, /api/devices/{id} and /api/wsrpc
+(srvWebSocketAuth, wskSubscribe, gdoModuleCommand and
+wskAttributeUpdateNtfy) for any number of simulated openers.
+
+    server = MockRyobiServer(devices=100)
+    await server.start()
+    auth = AsyncAuth(creds, http_endpoint=server.http_endpoint, ws_endpoint=server.ws_endpoint)
+
+Lives with the tests, outside the installed package, and is used by
+them and by benchmarks/bench_fleet.py.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from aiohttp import web, WSMsgType
+from ryobigdopy.models import DOOR_STATES
+
+_LOGGER = logging.getLogger(__name__)
+
+def device_payload(device_id, name=None):
+    """Return a get_device result entry for a closed door with the light off."""
+    now = int(time.time() * 1000)
+
+    def attribute(value):
+        return {"value": value, "lastSet": now, "lastValue": value}
+
+    return {
+        "varName": device_id,
+        "metaData": {
+            "name": name or f"Garage {device_id}",
+            "description": "Simulated garage door opener",
+            "version": 1,
+            "sys": {"lastSeen": now},
+        },
+        "deviceTypeIds": ["gdoMasterUnit", "gdoModule"],
+        "deviceTypeMap": {
+            "masterUnit": {"at": {
+                "serialNumber": attribute(f"SN{device_id}"),
+                "macAddress": attribute("00:00:00:00:00:00"),
+                "appVersion": attribute("1.0.0"),
+            }},
+            "garageDoor_4": {"at": {
+                "moduleId": attribute(5),
+                "portId": attribute(4),
+                "vacationMode": attribute(False),
+                "sensorFlag": attribute(False),
+                "doorState": dict(attribute(0), enum=list(DOOR_STATES)),
+                "doorPercentOpen": attribute(0),
+                "doorPosition": attribute(0),
+            }},
+            "garageLight_4": {"at": {
+                "moduleId": attribute(5),
+                "portId": attribute(4),
+                "lightState": attribute(False),
+                "lightTimer": attribute(0),
+            }},
+        },
+    }
+
+class MockRyobiServer:
+    """aiohttp application simulating an account with many openers."""
+
+    def __init__(self, devices=1, username="user@example.com", password="password", api_key="mock-api-key", door_travel_time=0.0):
+        """
+        :param devices: Number of openers, or an iterable of device ids.
+        :param door_travel_time: Seconds a door reports Opening/Closing before Open/Closed.
+        """
+        device_ids = [f"mock{index:05d}" for index in range(devices)] if isinstance(devices, int) else list(devices)
+        self.devices = {device_id: device_payload(device_id) for device_id in device_ids}
+        self.username = username
+        self.password = password
+        self.api_key = api_key
+        self.door_travel_time = door_travel_time
+        self.ignore_commands = False #Ack gdoModuleCommand without acting on it, so confirmations time out.
+        self.reject_subscribe = set() #Device ids whose next wskSubscribe is rejected.
+        self.login_delay = 0.0 #Seconds /api/login takes, to overlap concurrent logins.
+        self.logins = 0
+        self.version = 0 #Bumped on every state change, used as ETag.
+        self.subscribers = {} #device_id: set of websockets
+        self.commands = []
+        self.base_url = None
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/api/login", self.handle_login)
+        self.app.router.add_get("/api/devices", self.handle_devices)
+        self.app.router.add_get("/api/devices/{device_id}", self.handle_device)
+        self.app.router.add_get("/api/wsrpc", self.handle_websocket)
+
+    @property
+    def http_endpoint(self):
+        return f"{self.base_url}/api"
+
+    @property
+    def ws_endpoint(self):
+        return f"{self.base_url.replace('http', 'ws', 1)}/api/wsrpc"
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving. Returns the base url."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}"
+        _LOGGER.info("Mock Ryobi server listening on %s", self.base_url)
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def handle_login(self, request):
+        self.logins += 1
+        if self.login_delay:
+            await asyncio.sleep(self.login_delay)
+        data = json.loads(await request.text())
+        if data.get("username") != self.username or data.get("password") != self.password:
+            return web.json_response({"result": "Unauthorized"}, status=401)
+        return web.json_response({
+            "result": {
+                "varName": self.username,
+                "auth": {"apiKey": self.api_key},
+            },
+        })
+
+    async def handle_devices(self, request):
+        etag = f'"{self.version}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response({"result": list(self.devices.values())}, headers={"ETag": etag})
+
+    async def handle_device(self, request):
+        device = self.devices.get(request.match_info["device_id"])
+        if device is None:
+            return web.json_response({"result": []}, status=404)
+        return web.json_response({"result": [device]})
+
+    async def handle_websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        authorized = False
+        topics = []
+        try:
+            async for message in ws:
+                if message.type is not WSMsgType.TEXT:
+                    continue
+                data = json.loads(message.data)
+                method = data.get("method")
+                params = data.get("params", {})
+
+                if method == "srvWebSocketAuth":
+                    authorized = params.get("varName") == self.username and params.get("apiKey") == self.api_key
+                    await ws.send_json({"jsonrpc": "2.0", "method": "authorizedWebSocket", "params": {"authorized": authorized}})
+                    await self.reply(ws, data, {"authorized": authorized, "varName": params.get("varName"), "aCnt": 0})
+                elif not authorized:
+                    await self.reply(ws, data, {"result": "Unauthorized", "aCnt": 0})
+                elif method == "wskSubscribe":
+                    device_id = params.get("topic", "").partition(".")[0]
+                    if device_id in self.reject_subscribe:
+                        self.reject_subscribe.discard(device_id)
+                        result = "Rejected"
+                    elif device_id in self.devices:
+                        self.subscribers.setdefault(device_id, set()).add(ws)
+                        topics.append(device_id)
+                        result = "OK"
+                    else:
+                        result = "Unknown"
+                    await self.reply(ws, data, {"result": result, "aCnt": 0})
+                elif method == "gdoModuleCommand":
+                    await self.reply(ws, data, {"result": "OK", "aCnt": 0})
+                    self.commands.append(params)
+                    if not self.ignore_commands:
+                        asyncio.ensure_future(self.run_command(params))
+                else:
+                    await self.reply(ws, data, {"result": "Unknown method", "aCnt": 0})
+        finally:
+            for device_id in topics:
+                self.subscribers.get(device_id, set()).discard(ws)
+        return ws
+
+    async def reply(self, ws, request, result):
+        if "id" in request:
+            await ws.send_json({"jsonrpc": "2.0", "result": result, "id": request["id"]})
+
+    async def run_command(self, params):
+        """Simulate the opener acting on a gdoModuleCommand."""
+        device_id = params.get("topic")
+        for command, value in params.get("moduleMsg", {}).items():
+            if command == "lightState":
+                await self.notify(device_id, {"garageLight_4.lightState": str(value).lower() == "true"})
+            elif command == "doorCommand":
+                opening = str(value) == "1"
+                await self.notify(device_id, {"garageDoor_4.doorState": DOOR_STATES.index("Opening" if opening else "Closing")})
+                if self.door_travel_time:
+                    await asyncio.sleep(self.door_travel_time)
+                await self.notify(device_id, {
+                    "garageDoor_4.doorState": DOOR_STATES.index("Open" if opening else "Closed"),
+                    "garageDoor_4.doorPercentOpen": 100 if opening else 0,
+                })
+
+    def set_attributes(self, device_id, values):
+        """
+        Set attributes of a device and return the notification params.
+        :param values: {"garageDoor_4.doorState": 1, ...}
+        """
+        now = int(time.time() * 1000)
+        params = {"topic": f"{device_id}.wskAttributeUpdateNtfy", "varName": device_id}
+        type_map = self.devices[device_id]["deviceTypeMap"]
+        for key, value in values.items():
+            module, _, name = key.partition(".")
+            attribute = type_map[module]["at"][name]
+            attribute["lastValue"] = attribute["value"]
+            attribute["value"] = value
+            attribute["lastSet"] = now
+            params[key] = {"value": value, "lastValue": attribute["lastValue"], "lastSet": now}
+        self.version += 1
+        return params
+
+    async def notify(self, device_id, values):
+        """Change attributes and send wskAttributeUpdateNtfy to subscribers."""
+        params = self.set_attributes(device_id, values)
+        frame = json.dumps({"jsonrpc": "2.0", "method": "wskAttributeUpdateNtfy", "params": params})
+        for ws in list(self.subscribers.get(device_id, ())):
+            if not ws.closed:
+                await ws.send_str(frame)
+
+    async def disconnect_all(self):
+        """Drop every websocket, to exercise reconnects."""
+        for ws in {ws for sockets in self.subscribers.values() for ws in sockets}:
+            await ws.close()
@@ -0,0 +1,108 @@
+"""Credential caches and AsyncAuth logins against the offline mock server."""
+
+import asyncio
+import threading
+
+import pytest
+
+from mock_server import MockRyobiServer
+from ryobigdopy.auth import AsyncAuth
+from ryobigdopy.credentials import FileCredentialCache, MemoryCredentialCache
+
+@pytest.fixture(params=["memory", "file"])
+def cache_factory(request, tmp_path):
+    """Return a function making caches that share one store, like workers would."""
+    if request.param == "memory":
+        cache = MemoryCredentialCache()
+        return lambda: cache
+    path = str(tmp_path / "credentials.json")
+    return lambda: FileCredentialCache(path)
+
+def run(scenario):
+    async def main():
+        async with MockRyobiServer() as server:
+            auths = []
+
+            def new_auth(cache):
+                auth = AsyncAuth(
+                    {"username": server.username, "password": server.password},
+                    http_endpoint=server.http_endpoint,
+                    ws_endpoint=server.ws_endpoint,
+                    credential_cache=cache,
+                )
+                auths.append(auth)
+                return auth
+            try:
+                await scenario(server, new_auth)
+            finally:
+                for auth in auths:
+                    await auth.close()
+    asyncio.run(main())
+
+def test_miss_logs_in_and_stores_the_key(cache_factory):
+    async def scenario(server, new_auth):
+        cache = cache_factory()
+        response = await new_auth(cache).login()
+        assert server.logins == 1
+        assert response["result"]["auth"]["apiKey"] == server.api_key
+        assert cache.get(server.username) == server.api_key
+        assert cache.get_login_response(server.username) == response
+    run(scenario)
+
+def test_hit_skips_login_and_returns_the_payload(cache_factory):
+    async def scenario(server, new_auth):
+        first = await new_auth(cache_factory()).login()
+        auth = new_auth(cache_factory())
+        assert auth.api_key == server.api_key #Taken from the cache on creation.
+        assert await auth.login() == first
+        assert server.logins == 1
+    run(scenario)
+
+def test_concurrent_logins_are_single_flight(cache_factory):
+    async def scenario(server, new_auth):
+        server.login_delay = 0.1
+        auths = [new_auth(cache_factory()) for _ in range(5)]
+        responses = await asyncio.gather(*(auth.login() for auth in auths))
+        assert server.logins == 1
+        assert {auth.api_key for auth in auths} == {server.api_key}
+        assert all(response == responses[0] for response in responses)
+    run(scenario)
+
+def test_rejected_key_is_replaced_once(cache_factory):
+    async def scenario(server, new_auth):
+        first, second = new_auth(cache_factory()), new_auth(cache_factory())
+        await first.login()
+        await second.login()
+        server.api_key = "rotated-api-key"
+
+        first.reject_api_key()
+        await first.login()
+        assert first.api_key == "rotated-api-key"
+        assert server.logins == 2
+
+        second.reject_api_key() #Same old key, the cache already has the new one.
+        assert cache_factory().get(server.username) == "rotated-api-key"
+        await second.login()
+        assert second.api_key == "rotated-api-key"
+        assert server.logins == 2
+    run(scenario)
+
+def test_cancelled_login_releases_the_lock(cache_factory):
+    async def scenario(server, new_auth):
+        cache = cache_factory()
+        lock = cache.lock(server.username)
+        lock.acquire() #Another login holds the lock.
+        waiting = asyncio.ensure_future(new_auth(cache).login())
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        lock.release() #The cancelled login's thread takes the lock now and must hand it back.
+
+        taker = threading.Thread(target=lock.acquire, daemon=True) #Daemon, a leaked lock must not hang the run.
+        taker.start()
+        await asyncio.get_running_loop().run_in_executor(None, taker.join, 5)
+        assert not taker.is_alive(), "Lock still held after the login was cancelled."
+        lock.release()
+        assert server.logins == 0
+    run(scenario)
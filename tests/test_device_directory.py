@@ -0,0 +1,85 @@
+"""DeviceDirectory tests against the offline mock server."""
+
+import asyncio
+
+from mock_server import MockRyobiServer
+from ryobigdopy.auth import AsyncAuth
+from ryobigdopy.device_directory import DeviceDirectory
+
+def run(scenario, devices=3):
+    async def main():
+        async with MockRyobiServer(devices=devices) as server:
+            auth = AsyncAuth(
+                {"username": server.username, "password": server.password},
+                http_endpoint=server.http_endpoint,
+                ws_endpoint=server.ws_endpoint,
+            )
+            await auth.login()
+            try:
+                await scenario(server, auth)
+            finally:
+                await auth.close()
+    asyncio.run(main())
+
+def test_entries_go_stale_after_ttl():
+    async def scenario(server, auth):
+        directory = DeviceDirectory(ttl=0.2)
+        await directory.async_refresh(auth)
+        assert sorted(directory.device_ids()) == sorted(server.devices)
+        assert directory.stale_ids() == []
+        assert directory.get("mock00000")["varName"] == "mock00000"
+
+        await asyncio.sleep(0.3)
+        assert sorted(directory.stale_ids()) == sorted(server.devices)
+        assert directory.get("mock00000") is None
+        assert directory.get("mock00000", allow_stale=True)["varName"] == "mock00000"
+
+        server.set_attributes("mock00001", {"garageDoor_4.doorState": 1})
+        assert sorted(await directory.async_refresh_stale(auth)) == sorted(server.devices)
+        assert directory.stale_ids() == []
+        entry = directory.get("mock00001")
+        assert entry["deviceTypeMap"]["garageDoor_4"]["at"]["doorState"]["value"] == 1
+    run(scenario)
+
+def test_not_modified_refresh_keeps_entries_fresh():
+    async def scenario(server, auth):
+        directory = DeviceDirectory(ttl=0.2)
+        await directory.async_refresh(auth)
+        etag = directory.etag
+        await asyncio.sleep(0.3)
+        assert directory.stale_ids()
+
+        await directory.async_refresh(auth) #304, nothing changed on the server.
+        assert directory.etag == etag
+        assert directory.stale_ids() == []
+    run(scenario)
+
+def test_persisted_entries_keep_their_age(tmp_path):
+    async def scenario(server, auth):
+        path = str(tmp_path / "directory.json")
+        directory = DeviceDirectory(ttl=0.2, path=path)
+        await directory.async_refresh(auth)
+        await asyncio.sleep(0.3)
+
+        reloaded = DeviceDirectory(ttl=0.2, path=path)
+        assert sorted(reloaded.device_ids()) == sorted(server.devices)
+        assert sorted(reloaded.stale_ids()) == sorted(server.devices)
+    run(scenario, devices=2)
+
+def test_eviction_drops_the_etag():
+    async def scenario(server, auth):
+        directory = DeviceDirectory(max_size=2)
+        await directory.async_refresh(auth)
+        assert len(directory) == 2
+        assert directory.etag is None
+
+        await directory.async_refresh(auth) #Full fetch again, no 304 on a partial directory.
+        assert len(directory) == 2
+        assert directory.etag is None
+
+        directory = DeviceDirectory(max_size=3)
+        await directory.async_refresh(auth)
+        assert directory.etag is not None
+        directory.put("extra", {"varName": "extra"})
+        assert directory.etag is None
+    run(scenario)
@@ -0,0 +1,66 @@
+"""async_query retries and per-host limits against a throwaway aiohttp server."""
+
+import asyncio
+import time
+
+from aiohttp import web
+
+from ryobigdopy import http_api
+from ryobigdopy.auth import AsyncAuth
+
+def run(handler, limits):
+    """Serve handler on /api/test and call scenario(auth, url) with limits for its host."""
+    def decorator(scenario):
+        async def main():
+            app = web.Application()
+            app.router.add_get("/api/test", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            host = f"127.0.0.1:{runner.addresses[0][1]}"
+            auth = AsyncAuth({}, host_limits={host: limits}, http_endpoint=f"http://{host}/api")
+            try:
+                await scenario(auth, f"http://{host}/api/test")
+            finally:
+                await auth.close()
+                await runner.cleanup()
+        asyncio.run(main())
+    return decorator
+
+def test_retries_and_retry_after_come_from_the_host_limits():
+    hits = []
+
+    async def handler(request):
+        hits.append(time.monotonic())
+        if len(hits) == 1:
+            return web.Response(status=429, headers={"Retry-After": "0.3"})
+        return web.Response(status=503)
+
+    @run(handler, {"retries": 2, "backoff_factor": 0.01})
+    async def scenario(auth, url):
+        response = await http_api.async_query(auth, url)
+        assert response.status == 503
+        assert len(hits) == 3
+        assert hits[1] - hits[0] >= 0.3 #Retry-After.
+        assert hits[2] - hits[1] < 0.3 #backoff_factor of the host.
+
+def test_pool_maxsize_limits_requests_in_flight():
+    in_flight = [0, 0]
+
+    async def handler(request):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return web.json_response({})
+
+    @run(handler, {"pool_maxsize": 2})
+    async def scenario(auth, url):
+        await asyncio.gather(*(http_api.async_query(auth, url) for _ in range(8)))
+        assert in_flight[1] == 2
+
+def test_retry_after():
+    assert http_api.retry_after({"Retry-After": "2"}) == 2
+    assert http_api.retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert http_api.retry_after({"Retry-After": "soon"}) is None
+    assert http_api.retry_after({}) is None
@@ -0,0 +1,95 @@
+"""Journal segments, reads and offline replay."""
+
+from mock_server import device_payload
+from ryobigdopy import journal as journal_api
+from ryobigdopy.journal import Journal
+from ryobigdopy.ryobigdo import RyobiGDO
+
+SEGMENT_SIZE = 300 #A few records per segment.
+
+def notification(device_id, key, value):
+    return {"topic": f"{device_id}.wskAttributeUpdateNtfy", "varName": device_id,
+            key: {"value": value, "lastValue": value, "lastSet": 0}}
+
+def fill(journal, count, device_ids=("a", "b")):
+    """Append count notifications one second apart, starting at t=1000."""
+    for index in range(count):
+        device_id = device_ids[index % len(device_ids)]
+        journal.append(device_id, journal_api.NOTIFICATION,
+                       notification(device_id, "garageDoor_4.doorPosition", index), 1000 + index)
+
+def test_segments_rotate_at_segment_size(tmp_path):
+    journal = Journal(str(tmp_path), segment_size=SEGMENT_SIZE)
+    fill(journal, 20)
+    journal.close()
+    segments = journal.segments()
+    assert len(segments) > 3
+    assert all((tmp_path / path).stat().st_size <= SEGMENT_SIZE for _, path in segments)
+    assert segments[0][0] == 1000 * 1000 #Named after the first record.
+    assert [record.data["garageDoor_4.doorPosition"]["value"] for record in journal.read()] == list(range(20))
+
+def test_reopened_journal_resumes_the_last_segment(tmp_path):
+    journal = Journal(str(tmp_path), segment_size=SEGMENT_SIZE)
+    fill(journal, 1)
+    journal.close()
+    journal = Journal(str(tmp_path), segment_size=SEGMENT_SIZE)
+    journal.append("a", journal_api.COMMAND, {"target": "garageLight_4.lightState", "value": "true"}, 2000)
+    journal.close()
+    assert len(journal.segments()) == 1
+    assert [record.kind for record in journal.read()] == [journal_api.NOTIFICATION, journal_api.COMMAND]
+
+def test_max_segments_prunes_the_oldest(tmp_path):
+    journal = Journal(str(tmp_path), segment_size=SEGMENT_SIZE, max_segments=2)
+    fill(journal, 20)
+    journal.close()
+    segments = journal.segments()
+    assert len(segments) == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == [path.rpartition("/")[2] for _, path in segments]
+    values = [record.data["garageDoor_4.doorPosition"]["value"] for record in journal.read()]
+    assert values == list(range(20 - len(values), 20)) #Newest records, none missing between.
+
+def test_read_skips_segments_outside_the_range(tmp_path, monkeypatch):
+    journal = Journal(str(tmp_path), segment_size=SEGMENT_SIZE)
+    fill(journal, 20)
+    journal.close()
+    segments = [path for _, path in journal.segments()]
+    opened = []
+    read_segment = journal._read_segment
+
+    def spy(path, needle):
+        opened.append(path)
+        return read_segment(path, needle)
+    monkeypatch.setattr(journal, "_read_segment", spy)
+
+    records = list(journal.read(start=1008, end=1011))
+    assert [record.timestamp for record in records] == [1008, 1009, 1010, 1011]
+    assert segments[0] not in opened
+    assert segments[-1] not in opened
+    assert len(opened) < len(segments)
+
+    opened.clear()
+    records = list(journal.read(start=1008, end=1011, device_id="a"))
+    assert [record.timestamp for record in records] == [1008, 1010]
+    assert len(opened) < len(segments)
+
+def test_from_journal_replays_up_to_end(tmp_path):
+    journal = Journal(str(tmp_path), segment_size=SEGMENT_SIZE)
+    journal.append("a", journal_api.ENTRY, device_payload("a"), 1000)
+    journal.append("b", journal_api.ENTRY, device_payload("b"), 1001)
+    journal.append("a", journal_api.NOTIFICATION, notification("a", "garageDoor_4.doorState", 1), 1002)
+    journal.append("a", journal_api.COMMAND, {"target": "garageLight_4.lightState", "value": "true"}, 1003)
+    journal.append("a", journal_api.NOTIFICATION, notification("a", "garageLight_4.lightState", True), 1004)
+    journal.append("a", journal_api.NOTIFICATION, notification("a", "garageDoor_4.doorState", 0), 1005)
+    journal.close()
+    assert len(journal.segments()) > 1
+
+    gdo = RyobiGDO.from_journal(journal, "a", end=1004)
+    assert gdo.name == "Garage a"
+    assert gdo.door.doorState.state == "Open"
+    assert gdo.light.lightState.value is True
+    assert gdo.lastUpdate == 1004
+
+    gdo = RyobiGDO.from_journal(journal, "a")
+    assert gdo.door.doorState.state == "Closed"
+    assert gdo.lastUpdate == 1005
+    assert RyobiGDO.from_journal(journal, "b").light.lightState.value is False
@@ -0,0 +1,86 @@
+"""NotificationQueue overflow policies."""
+
+import asyncio
+
+from ryobigdopy.ws_api import (
+    NotificationQueue,
+    POLICY_BLOCK,
+    POLICY_COALESCE,
+    POLICY_DROP_OLDEST,
+)
+
+def notification(topic, index, method="wskAttributeUpdateNtfy"):
+    return {"method": method, "params": {"topic": topic, "index": index, f"at{index}": index}}
+
+def drain(queue):
+    async def main():
+        return [await queue.get() for _ in range(len(queue))]
+    return asyncio.run(main())
+
+def new_queue(*args, **kwargs):
+    async def main(): #Events bind to the running loop on older Pythons.
+        return NotificationQueue(*args, **kwargs)
+    return asyncio.run(main())
+
+def test_block_holds_everything_in_order_up_to_the_backlog():
+    queue = new_queue(maxsize=3, backlog=2)
+    for index in range(5):
+        assert not queue.full()
+        queue.offer(notification("a", index))
+    assert queue.full()
+    assert queue.stats()["held"] == 2
+    assert [data["params"]["index"] for data in drain(queue)] == [0, 1, 2, 3, 4]
+    assert not queue.full()
+
+def test_reader_waits_for_room_after_the_backlog():
+    async def main():
+        queue = NotificationQueue(maxsize=2, backlog=1)
+        for index in range(3):
+            queue.offer(notification("a", index))
+        waiter = asyncio.ensure_future(queue.room())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        await queue.get()
+        await asyncio.sleep(0)
+        assert waiter.done()
+    asyncio.run(main())
+
+def test_drop_oldest_only_evicts_its_own_policy():
+    queue = new_queue(maxsize=3, policies={"fast": POLICY_DROP_OLDEST})
+    queue.offer(notification("slow", 0))
+    queue.offer(notification("fast", 1))
+    queue.offer(notification("slow", 2))
+    queue.offer(notification("fast", 3)) #Evicts fast 1, not slow 0.
+    queue.offer(notification("slow", 4)) #Blocking policy, held past maxsize.
+    queue.offer(notification("fast", 5)) #Evicts fast 3, stays behind slow 4.
+    stats = queue.stats()
+    assert (stats["dropped"], stats["held"]) == (2, 1)
+    assert [(data["params"]["topic"], data["params"]["index"]) for data in drain(queue)] == [
+        ("slow", 0), ("slow", 2), ("slow", 4), ("fast", 5),
+    ]
+
+def test_drop_oldest_without_a_victim_is_held():
+    queue = new_queue(maxsize=1, policies={"fast": POLICY_DROP_OLDEST})
+    queue.offer(notification("slow", 0))
+    queue.offer(notification("fast", 1))
+    assert queue.stats()["dropped"] == 0
+    assert [data["params"]["index"] for data in drain(queue)] == [0, 1]
+
+def test_coalesce_merges_queued_notifications_of_a_topic():
+    queue = new_queue(maxsize=10, default=POLICY_COALESCE)
+    queue.offer(notification("a", 0))
+    queue.offer(notification("b", 1))
+    queue.offer(notification("a", 2))
+    assert queue.stats()["coalesced"] == 1
+    first, second = drain(queue)
+    assert first["params"] == {"topic": "a", "index": 2, "at0": 0, "at2": 2}
+    assert second["params"]["topic"] == "b"
+
+    queue.offer(notification("a", 3)) #The merged one was delivered, so this one is queued.
+    assert drain(queue)[0]["params"]["index"] == 3
+
+def test_policy_by_method():
+    queue = new_queue(maxsize=1, policies={"other": POLICY_DROP_OLDEST}, default=POLICY_BLOCK)
+    queue.offer(notification("a", 0, method="other"))
+    queue.offer(notification("b", 1, method="other"))
+    assert [data["params"]["index"] for data in drain(queue)] == [1]
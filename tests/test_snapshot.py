@@ -0,0 +1,65 @@
+"""FleetSnapshot round trips of devices loaded from the offline mock server."""
+
+import asyncio
+
+from mock_server import MockRyobiServer
+from ryobigdopy import snapshot
+from ryobigdopy.auth import AsyncAuth
+from ryobigdopy.ryobigdo import RyobiGDO
+
+def load_devices(changes):
+    """Return RyobiGDOs of a mock account after applying {device_id: values}."""
+    async def main():
+        async with MockRyobiServer(devices=3) as server:
+            for device_id, values in changes.items():
+                server.set_attributes(device_id, values)
+            auth = AsyncAuth(
+                {"username": server.username, "password": server.password},
+                http_endpoint=server.http_endpoint,
+                ws_endpoint=server.ws_endpoint,
+            )
+            await auth.login()
+            gdos = [RyobiGDO(auth, device_id) for device_id in server.devices]
+            try:
+                for gdo in gdos:
+                    await gdo.async_update_device()
+            finally:
+                await auth.close()
+            return gdos
+    return asyncio.run(main())
+
+def state(gdo):
+    return (
+        gdo.device_id,
+        gdo.name,
+        gdo.version,
+        gdo.lastSeen,
+        gdo.serial,
+        gdo.garageDoor,
+        gdo.garageLight,
+        gdo.door.doorState.enum,
+    )
+
+def test_round_trip(tmp_path):
+    gdos = load_devices({
+        "mock00001": {"garageDoor_4.doorState": 1, "garageDoor_4.doorPercentOpen": 100},
+        "mock00002": {"garageLight_4.lightState": True},
+    })
+    path = str(tmp_path / "fleet.snapshot")
+    snapshot.snapshot(gdos, path)
+
+    for source in (path, snapshot.FleetSnapshot.load(path).tobytes()):
+        restored = snapshot.restore(source)
+        assert [state(gdo) for gdo in restored] == [state(gdo) for gdo in gdos]
+    assert restored[1].door.doorState.state == "Open"
+    assert restored[1].door.doorState.lastValue == 0
+    assert restored[2].light.lightState.value is True
+
+def test_apply_updates_existing_devices():
+    gdos = load_devices({"mock00000": {"garageDoor_4.doorState": 2}})
+    fleet_snapshot = snapshot.FleetSnapshot.capture(gdos)
+    targets = load_devices({})
+    assert targets[0].door.doorState.state == "Closed"
+
+    assert fleet_snapshot.apply(targets) == len(gdos)
+    assert [state(gdo) for gdo in targets] == [state(gdo) for gdo in gdos]
@@ -0,0 +1,159 @@
+"""Websocket hub tests against the offline mock server."""
+
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+
+from mock_server import MockRyobiServer, device_payload
+from ryobigdopy.auth import Auth, AsyncAuth
+from ryobigdopy.ryobigdo import RyobiGDO
+from ryobigdopy.scheduler import CommandTimeoutError
+from ryobigdopy.ws_api import RyobiWebsocketHub, STATE_CLOSED, STATE_CONNECTED, STATE_STOPPED
+
+async def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time.")
+        await asyncio.sleep(0.01)
+
+def run_hub(scenario, devices=2):
+    """Run scenario(server, devices, hub) with loaded devices on a listening hub."""
+    async def main():
+        async with MockRyobiServer(devices=devices) as server:
+            auth = AsyncAuth(
+                {"username": server.username, "password": server.password},
+                http_endpoint=server.http_endpoint,
+                ws_endpoint=server.ws_endpoint,
+            )
+            await auth.login()
+            gdos = [RyobiGDO(auth, device_id) for device_id in server.devices]
+            for gdo in gdos:
+                await gdo.async_update_device()
+            hub = RyobiWebsocketHub(auth)
+            for gdo in gdos:
+                gdo.connect_ws(hub)
+            listener = asyncio.ensure_future(hub.listen())
+            try:
+                await wait_for(lambda: hub.state == STATE_CONNECTED)
+                await scenario(server, gdos, hub)
+            finally:
+                hub.close()
+                await listener
+                await auth.close()
+    asyncio.run(main())
+
+def test_hub_subscribes_every_device():
+    async def scenario(server, gdos, hub):
+        assert set(server.subscribers) == {gdo.device_id for gdo in gdos}
+        assert all(len(sockets) == 1 for sockets in server.subscribers.values())
+        assert all(gdo.wsState == STATE_CONNECTED for gdo in gdos)
+
+        await server.notify(gdos[0].device_id, {"garageDoor_4.doorState": 1})
+        await wait_for(lambda: gdos[0].door.doorState.state == "Open")
+        assert gdos[1].door.doorState.state == "Closed"
+    run_hub(scenario)
+
+def test_command_is_acked_and_confirmed():
+    async def scenario(server, gdos, hub):
+        reply = await gdos[0].send_command("lightState", "true")
+        assert reply["result"]["result"] == "OK"
+        assert server.commands[-1]["topic"] == gdos[0].device_id
+        assert server.commands[-1]["moduleMsg"] == {"lightState": "true"}
+
+        assert await gdos[1].open_door() == gdos[1].door.doorState.enum.index("Opening") #First confirming value.
+        await wait_for(lambda: gdos[1].door.doorState.state == "Open")
+    run_hub(scenario)
+
+def test_unconfirmed_command_times_out_and_rolls_back():
+    async def scenario(server, gdos, hub):
+        server.ignore_commands = True
+        handle = gdos[0].expect("lightState", "true", "lightState", (True,), True, timeout=0.2)
+        assert gdos[0].light.lightState.value is True #Optimistic.
+        with pytest.raises(CommandTimeoutError):
+            await handle
+        assert gdos[0].light.lightState.value is False
+        assert not gdos[0].pending
+    run_hub(scenario, devices=1)
+
+def test_hub_reconnects_after_disconnect():
+    async def scenario(server, gdos, hub):
+        await server.disconnect_all()
+        await wait_for(lambda: hub.state != STATE_CONNECTED)
+        await wait_for(lambda: hub.state == STATE_CONNECTED)
+        await wait_for(lambda: set(server.subscribers) == {gdo.device_id for gdo in gdos}
+                       and all(server.subscribers.values()))
+
+        await server.notify(gdos[1].device_id, {"garageLight_4.lightState": True})
+        await wait_for(lambda: gdos[1].light.lightState.value is True)
+    run_hub(scenario)
+
+def test_timed_out_command_still_queued_is_not_sent():
+    async def scenario(server, gdos, hub):
+        gdo = gdos[0]
+        gdo.scheduler.min_interval = 0.5
+        await gdo.send_command("lightState", "true") #Starts the spacing of the next send.
+        with pytest.raises(CommandTimeoutError):
+            await gdo.expect("doorCommand", "1", "doorState", (3, 1), 3, timeout=0.1)
+        assert gdo.door.doorState.state == "Closed"
+        await asyncio.sleep(0.6)
+        assert [command["moduleMsg"] for command in server.commands] == [{"lightState": "true"}]
+        assert gdo.door.doorState.state == "Closed"
+    run_hub(scenario, devices=1)
+
+def test_device_added_while_connected_is_subscribed():
+    async def scenario(server, gdos, hub):
+        late = RyobiGDO(gdos[0].auth, "late", fetch=False)
+        server.devices["late"] = device_payload("late")
+        late.connect_ws(hub)
+        await wait_for(lambda: server.subscribers.get("late"))
+        await server.notify("late", {"garageLight_4.lightState": True})
+        await wait_for(lambda: late.light.lightState.value is True)
+    run_hub(scenario, devices=1)
+
+def test_rejected_late_subscribe_reconnects(caplog):
+    async def scenario(server, gdos, hub):
+        states = []
+        late = RyobiGDO(gdos[0].auth, "late", fetch=False)
+        server.devices["late"] = device_payload("late")
+        server.reject_subscribe.add("late")
+        hub.callbacks["watch"] = lambda signal, data, error: states.append(data)
+        late.connect_ws(hub)
+        await wait_for(lambda: server.subscribers.get("late"))
+        assert "Reconnecting" in caplog.text
+        assert STATE_CLOSED in states
+        assert server.subscribers.get(gdos[0].device_id)
+    run_hub(scenario, devices=1)
+
+def test_sync_connect_ws_stops_from_another_thread(caplog):
+    loop = asyncio.new_event_loop()
+    server_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    server_thread.start()
+    server = MockRyobiServer(devices=1)
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    try:
+        auth = Auth(
+            {"username": server.username, "password": server.password},
+            http_endpoint=server.http_endpoint,
+            ws_endpoint=server.ws_endpoint,
+        )
+        gdo = RyobiGDO(auth, "mock00000")
+
+        def stop_when_connected():
+            deadline = time.monotonic() + 10
+            while gdo.wsState != STATE_CONNECTED and time.monotonic() < deadline:
+                time.sleep(0.01)
+            gdo.close_ws()
+        stopper = threading.Thread(target=stop_when_connected)
+        stopper.start()
+        gdo.connect_ws(poll=False) #Blocks until close_ws().
+        stopper.join()
+        assert gdo.wsState == STATE_STOPPED
+        assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    finally:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        server_thread.join()